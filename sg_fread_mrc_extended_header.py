@@ -0,0 +1,195 @@
+import datetime
+import numpy as np
+import sg_fread_mrcheader as fread
+
+# Per-section metadata returned for all extended header types
+section_dtype = np.dtype([
+    ('tilt_angle', np.float64),      # degrees
+    ('dose', np.float64),            # e/A^2
+    ('defocus', np.float64),         # microns, negative for underfocus
+    ('exposure_time', np.float64),   # seconds
+    ('pixel_spacing', np.float64),   # Angstroms
+    ('stage_x', np.float64),         # microns
+    ('stage_y', np.float64),         # microns
+    ('magnification', np.float64),
+    ('timestamp', np.float64),       # OLE automation date (days since 30-Dec-1899)
+])
+
+# SerialEM nreal flags and the number of bytes stored per section for each
+serialem_flag_bytes = [(1, 2), (2, 6), (4, 4), (8, 2), (16, 2), (32, 4), (64, 2), (128, 4), (256, 2), (512, 4), (1024, 2)]
+
+
+def sg_fread_mrc_extended_header(fid, header):
+    """
+    Read and decode the extended header of an opened MRC file.
+
+    FEI1/FEI2 (Thermo Fisher) and SerialEM extended headers are read in a
+    single call and decoded into a per-section record array. Values that are
+    not stored in the extended header are NaN.
+
+    Parameters:
+    -----------
+    fid : file object
+        The opened MRC file
+    header : dict
+        Header returned by sg_fread_mrcheader
+
+    Returns:
+    --------
+    sections : numpy.recarray or None
+        Per-section metadata with the fields of section_dtype, or None if the
+        file has no supported extended header
+    """
+    n_ext = int(header['next'])
+    nz = int(header['nz'])
+    if n_ext <= 0 or nz <= 0:
+        return None
+
+    # Read the whole extended header at once
+    fid.seek(1024, 0)
+    buffer = fid.read(n_ext)
+    if len(buffer) != n_ext:
+        raise IOError("ACHTUNG!!! MRC extended header is truncated!!!")
+
+    exttyp = header.get('exttyp', '')
+    if exttyp in ['FEI1', 'FEI2']:
+        sections = decode_fei_extended_header(buffer, nz)
+    elif exttyp == 'SERI' or (exttyp.strip('\x00') == '' and int(header['nint']) > 0):
+        sections = decode_serialem_extended_header(buffer, nz, int(header['nint']), int(header['nreal']))
+    else:
+        return None
+
+    # Pixel spacing from the main header when it is not stored per section
+    if sections is not None and header['mx'] > 0:
+        missing = np.isnan(sections['pixel_spacing'])
+        sections['pixel_spacing'][missing] = float(header['xlen']) / float(header['mx'])
+
+    return sections
+
+
+def sg_read_mrc_extended_header(mrc_name):
+    """
+    Read the header and decoded extended header of an MRC file without
+    reading any pixel data.
+
+    Returns:
+    --------
+    header : dict
+        MRC header information
+    sections : numpy.recarray or None
+        Per-section metadata (see sg_fread_mrc_extended_header)
+    """
+    with open(mrc_name, 'rb') as fid:
+        fid, header = fread.sg_fread_mrcheader(fid)
+        sections = sg_fread_mrc_extended_header(fid, header)
+
+    return header, sections
+
+
+def fei_extended_header_dtype(metadata_size):
+    """
+    Structured dtype of one FEI1/FEI2 metadata block. Only the fields used
+    for per-section metadata are named; the rest of the block is skipped.
+    """
+    fields = [
+        ('metadata_size', '<i4', 0),
+        ('metadata_version', '<i4', 4),
+        ('timestamp', '<f8', 12),
+        ('ht', '<f8', 84),
+        ('dose', '<f8', 92),               # e/m^2
+        ('alpha_tilt', '<f8', 100),        # degrees
+        ('beta_tilt', '<f8', 108),
+        ('x_stage', '<f8', 116),           # meters
+        ('y_stage', '<f8', 124),
+        ('z_stage', '<f8', 132),
+        ('tilt_axis_angle', '<f8', 140),
+        ('pixel_size_x', '<f8', 156),      # meters
+        ('pixel_size_y', '<f8', 164),
+        ('defocus', '<f8', 220),           # meters
+        ('magnification', '<f8', 289),
+        ('integration_time', '<f8', 419),  # seconds
+    ]
+    dtype = np.dtype({
+        'names': [f[0] for f in fields],
+        'formats': [f[1] for f in fields],
+        'offsets': [f[2] for f in fields],
+        'itemsize': metadata_size,
+    })
+
+    return dtype
+
+
+def decode_fei_extended_header(buffer, nz):
+    """
+    Decode FEI1/FEI2 metadata blocks into per-section records.
+    """
+    metadata_size = int(np.frombuffer(buffer, dtype='<i4', count=1)[0])
+    if metadata_size <= 0 or metadata_size * nz > len(buffer):
+        print("ACHTUNG!!! Invalid FEI extended header!!!")
+        return None
+
+    blocks = np.frombuffer(buffer, dtype=fei_extended_header_dtype(metadata_size), count=nz)
+
+    sections = np.full(nz, np.nan, dtype=section_dtype).view(np.recarray)
+    sections['tilt_angle'] = blocks['alpha_tilt']
+    sections['dose'] = blocks['dose'] * 1e-20
+    sections['defocus'] = blocks['defocus'] * 1e6
+    sections['exposure_time'] = blocks['integration_time']
+    sections['pixel_spacing'] = np.where(blocks['pixel_size_x'] > 0, blocks['pixel_size_x'] * 1e10, np.nan)
+    sections['stage_x'] = blocks['x_stage'] * 1e6
+    sections['stage_y'] = blocks['y_stage'] * 1e6
+    sections['magnification'] = blocks['magnification']
+    sections['timestamp'] = blocks['timestamp']
+
+    return sections
+
+
+def decode_serialem_extended_header(buffer, nz, nint, nreal):
+    """
+    Decode a SerialEM extended header, where nint is the number of bytes per
+    section and nreal is a bit field of the stored items.
+    """
+    # Byte offset of each stored item
+    offsets = {}
+    n_bytes = 0
+    for flag, size in serialem_flag_bytes:
+        if nreal & flag:
+            offsets[flag] = n_bytes
+            n_bytes += size
+
+    if n_bytes != nint or nint * nz > len(buffer):
+        print("ACHTUNG!!! Extended header is not in SerialEM format!!!")
+        return None
+
+    # View the sections as an (nz, nint) byte array
+    raw = np.frombuffer(buffer, dtype=np.uint8, count=nint * nz).reshape(nz, nint)
+
+    def shorts(flag, count=1):
+        offset = offsets[flag]
+        return raw[:, offset:offset + 2 * count].copy().view('<i2').astype(np.float64)
+
+    sections = np.full(nz, np.nan, dtype=section_dtype).view(np.recarray)
+    if 1 in offsets:
+        sections['tilt_angle'] = shorts(1)[:, 0] / 100
+    if 4 in offsets:
+        stage = shorts(4, 2)
+        sections['stage_x'] = stage[:, 0] / 25
+        sections['stage_y'] = stage[:, 1] / 25
+    if 8 in offsets:
+        sections['magnification'] = shorts(8)[:, 0] * 100
+    if 32 in offsets:
+        # Dose is packed as two shorts: mantissa and sign in the first, exponent in the second
+        packed = shorts(32, 2)
+        low, high = packed[:, 0], packed[:, 1]
+        sign_low = np.where(low < 0, -1.0, 1.0)
+        sign_high = np.where(high < 0, -1.0, 1.0)
+        sections['dose'] = sign_low * (np.abs(low) * 256 + np.abs(high) % 256) * 2.0 ** (sign_high * (np.abs(high) // 256))
+
+    return sections
+
+
+def timestamp_to_datetime(timestamp):
+    """
+    Convert an OLE automation date to a datetime.
+    """
+    return datetime.datetime(1899, 12, 30) + datetime.timedelta(days=float(timestamp))
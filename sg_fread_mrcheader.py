@@ -1,9 +1,12 @@
-import sys
-import struct
 import numpy as np
+import sg_mrc_header_dtype as sg_mrc_header_dtype
 def sg_fread_mrcheader(fid):
     """
     Read the header information of the opened MRC file.
+    
+    The 1024-byte header is read in a single call and decoded through a
+    structured dtype. Big-endian files are detected from the machine stamp.
+    
     Parameter:
     fid: The opened file object
     Return:
@@ -11,93 +14,53 @@ def sg_fread_mrcheader(fid):
     header: A dictionary containing header information
 
     """
-    import numpy as np
-    
-    # Create a dictionary of header information
-    header = {}
+    buffer = fid.read(1024)
+    if len(buffer) != 1024:
+        raise IOError("ACHTUNG!!! MRC header is truncated!!!")
     
-    # Dimension (column, row, slice)
-    header['nx'] = np.fromfile(fid, dtype=np.int32, count=1)[0]
-    header['ny'] = np.fromfile(fid, dtype=np.int32, count=1)[0]
-    header['nz'] = np.fromfile(fid, dtype=np.int32, count=1)[0]
-    
-    header['mode'] = np.fromfile(fid, dtype=np.int32, count=1)[0]
-    
-    # The starting point of the sub-image (not used in IMOD)
-    header['nxstart'] = np.fromfile(fid, dtype=np.int32, count=1)[0]
-    header['nystart'] = np.fromfile(fid, dtype=np.int32, count=1)[0]
-    header['nzstart'] = np.fromfile(fid, dtype=np.int32, count=1)[0]
-    
-    # The grid sizes in x,y, and z
-    header['mx'] = np.fromfile(fid, dtype=np.int32, count=1)[0]
-    header['my'] = np.fromfile(fid, dtype=np.int32, count=1)[0]
-    header['mz'] = np.fromfile(fid, dtype=np.int32, count=1)[0]
+    header = sg_mrc_header_from_bytes(buffer)
     
+    return fid, header
 
-    # Cell size in angstroms (pixel pitch = xlen/mx, ylen/my, zlen/mz)
-    header['xlen'] = np.fromfile(fid, dtype=np.float32, count=1)[0]
-    header['ylen'] = np.fromfile(fid, dtype=np.float32, count=1)[0]
-    header['zlen'] = np.fromfile(fid, dtype=np.float32, count=1)[0]
-    
-    # Cell Angle (ignored in IMOD)
-    header['alpha'] = np.fromfile(fid, dtype=np.float32, count=1)[0]
-    header['beta'] = np.fromfile(fid, dtype=np.float32, count=1)[0]
-    header['gamma'] = np.fromfile(fid, dtype=np.float32, count=1)[0]
-    
-    # Map columns, rows and slices. It must be set to 1,2,3 to obtain the correct pixel pitch.
-    header['mapc'] = np.fromfile(fid, dtype=np.int32, count=1)[0]
-    header['mapr'] = np.fromfile(fid, dtype=np.int32, count=1)[0]
-    header['maps'] = np.fromfile(fid, dtype=np.int32, count=1)[0]
-    
-    # Data value information (must be set for appropriate scaling)
-    header['amin'] = np.fromfile(fid, dtype=np.float32, count=1)[0]
-    header['amax'] = np.fromfile(fid, dtype=np.float32, count=1)[0]
-    header['amean'] = np.fromfile(fid, dtype=np.float32, count=1)[0]
-    
-    header['ispg'] = np.fromfile(fid, dtype=np.int16, count=1)[0]
-    header['nsymbt'] = np.fromfile(fid, dtype=np.int16, count=1)[0]
-    
-    header['next'] = np.fromfile(fid, dtype=np.int32, count=1)[0]
-    
-    header['creatid'] = np.fromfile(fid, dtype=np.int16, count=1)[0]
-    
-    fid.seek(30, 1)
-    
-    header['nint'] = np.fromfile(fid, dtype=np.int16, count=1)[0]
-    
-    header['nreal'] = np.fromfile(fid, dtype=np.int16, count=1)[0]
-    
-    fid.seek(28, 1) 
-    
-    header['idtype'] = np.fromfile(fid, dtype=np.int16, count=1)[0]
-    header['lens'] = np.fromfile(fid, dtype=np.int16, count=1)[0]
-    header['nd1'] = np.fromfile(fid, dtype=np.int16, count=1)[0]
-    header['nd2'] = np.fromfile(fid, dtype=np.int16, count=1)[0]
-    header['vd1'] = np.fromfile(fid, dtype=np.int16, count=1)[0]
-    header['vd2'] = np.fromfile(fid, dtype=np.int16, count=1)[0]
-    
-    header['tiltangles'] = np.fromfile(fid, dtype=np.float32, count=6)
-    
-    header['xorg'] = np.fromfile(fid, dtype=np.float32, count=1)[0]
-    header['yorg'] = np.fromfile(fid, dtype=np.float32, count=1)[0]
-    header['zorg'] = np.fromfile(fid, dtype=np.float32, count=1)[0]
-    
-    header['cmap'] = ''.join([chr(c) for c in np.fromfile(fid, dtype=np.int8, count=4)])
-    
-    header['stamp'] = np.fromfile(fid, dtype=np.int8, count=4)
-    
-    header['rms'] = np.fromfile(fid, dtype=np.float32, count=1)[0]
-    
-    header['nlabl'] = np.fromfile(fid, dtype=np.int32, count=1)[0]
-    
-    labl = np.fromfile(fid, dtype=np.int8, count=800)
-    
-    labl = labl.reshape((10, 80))
-    header['labl'] = []
-    
-    for i in range(header['nlabl']):
 
-        label_str = ''.join([chr(c) for c in labl[i] if c != 0]) 
-        header['labl'].append(label_str)
+def sg_mrc_header_from_bytes(buffer):
+    """
+    Decode a 1024-byte MRC header buffer into a header dictionary.
+    """
+    # Machine stamp is at byte 212; fall back to checking the mode if it is unset
+    endian = sg_mrc_header_dtype.sg_mrc_stamp_endian(np.frombuffer(buffer, dtype=np.int8, count=4, offset=212))
+    if np.frombuffer(buffer, dtype=np.int8, count=1, offset=212)[0] == 0:
+        mode = np.frombuffer(buffer, dtype='<i4', count=1, offset=12)[0]
+        if not 0 <= mode <= 0xFFFF:
+            endian = '>'
+    
+    raw = np.frombuffer(buffer, dtype=sg_mrc_header_dtype.sg_mrc_header_dtype(endian), count=1)[0]
     
-    return fid, header
\ No newline at end of file
+    # Create a dictionary of header information
+    header = {}
+    for name in ['nx', 'ny', 'nz', 'mode',
+                 'nxstart', 'nystart', 'nzstart',
+                 'mx', 'my', 'mz',
+                 'xlen', 'ylen', 'zlen',
+                 'alpha', 'beta', 'gamma',
+                 'mapc', 'mapr', 'maps',
+                 'amin', 'amax', 'amean',
+                 'ispg', 'nsymbt', 'next', 'creatid',
+                 'nint', 'nreal',
+                 'idtype', 'lens', 'nd1', 'nd2', 'vd1', 'vd2',
+                 'xorg', 'yorg', 'zorg',
+                 'rms', 'nlabl']:
+        header[name] = raw[name]
+    
+    header['tiltangles'] = raw['tiltangles'].astype(np.float32)
+    header['cmap'] = raw['cmap'].decode('ascii', errors='replace')
+    header['exttyp'] = raw['exttyp'].decode('ascii', errors='replace')
+    header['stamp'] = np.array(raw['stamp'], dtype=np.int8)
+    if header['stamp'][0] == 0:
+        # Record the detected byte order so data readers can rely on the stamp
+        header['stamp'] = np.array([68, 65, 0, 0] if endian == '<' else [17, 17, 0, 0], dtype=np.int8)
+    
+    n_labl = min(max(int(header['nlabl']), 0), 10)
+    header['labl'] = [raw['labl'][i].decode('ascii', errors='replace') for i in range(n_labl)]
+    
+    return header
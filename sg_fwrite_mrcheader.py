@@ -1,65 +1,64 @@
 import numpy as np
+import sg_mrc_header_dtype as sg_mrc_header_dtype
 def sg_fwrite_mrcheader(fid, header):
-    '''Write the MRC header information to the file'''
-    # 解析标签
-    label = np.zeros(800, dtype=np.int8)
-    
-    for i in range(header['nlabl']):
-        s_idx = i * 80
-        if len(header['labl'][i]) > 80:
-            header['labl'][i] = header['labl'][i][:80]
-        
-        for j, char in enumerate(header['labl'][i]):
-            label[s_idx + j] = ord(char)
+    '''
+    Write the MRC header information to the file.
     
+    The header is packed into the structured header dtype and written with a
+    single call. Headers are always written little-endian.
+    '''
     # Write header information
-    fid.write(np.array(header['nx'], dtype=np.int32).tobytes())
-    fid.write(np.array(header['ny'], dtype=np.int32).tobytes())
-    fid.write(np.array(header['nz'], dtype=np.int32).tobytes())
-    fid.write(np.array(header['mode'], dtype=np.int32).tobytes())
-    fid.write(np.array(header['nxstart'], dtype=np.int32).tobytes())
-    fid.write(np.array(header['nystart'], dtype=np.int32).tobytes())
-    fid.write(np.array(header['nzstart'], dtype=np.int32).tobytes())
-    fid.write(np.array(header['mx'], dtype=np.int32).tobytes())
-    fid.write(np.array(header['my'], dtype=np.int32).tobytes())
-    fid.write(np.array(header['mz'], dtype=np.int32).tobytes())
-    fid.write(np.array(header['xlen'], dtype=np.float32).tobytes())
-    fid.write(np.array(header['ylen'], dtype=np.float32).tobytes())
-    fid.write(np.array(header['zlen'], dtype=np.float32).tobytes())
-    fid.write(np.array(header['alpha'], dtype=np.float32).tobytes())
-    fid.write(np.array(header['beta'], dtype=np.float32).tobytes())
-    fid.write(np.array(header['gamma'], dtype=np.float32).tobytes())
-    fid.write(np.array(header['mapc'], dtype=np.int32).tobytes())
-    fid.write(np.array(header['mapr'], dtype=np.int32).tobytes())
-    fid.write(np.array(header['maps'], dtype=np.int32).tobytes())
-    fid.write(np.array(header['amin'], dtype=np.float32).tobytes())
-    fid.write(np.array(header['amax'], dtype=np.float32).tobytes())
-    fid.write(np.array(header['amean'], dtype=np.float32).tobytes())
-    fid.write(np.array(header['ispg'], dtype=np.int16).tobytes())
-    fid.write(np.array(header['nsymbt'], dtype=np.int16).tobytes())
-    fid.write(np.array(header['next'], dtype=np.int32).tobytes())
-    fid.write(np.array(header['creatid'], dtype=np.int16).tobytes())
-    fid.write(np.zeros(30, dtype=np.int8).tobytes())  
-    fid.write(np.array(header['nint'], dtype=np.int16).tobytes())
-    fid.write(np.array(header['nreal'], dtype=np.int16).tobytes())
-    fid.write(np.zeros(28, dtype=np.int8).tobytes())  
-    fid.write(np.array(header['idtype'], dtype=np.int16).tobytes())
-    fid.write(np.array(header['lens'], dtype=np.int16).tobytes())
-    fid.write(np.array(header['nd1'], dtype=np.int16).tobytes())
-    fid.write(np.array(header['nd2'], dtype=np.int16).tobytes())
-    fid.write(np.array(header['vd1'], dtype=np.int16).tobytes())
-    fid.write(np.array(header['vd2'], dtype=np.int16).tobytes())
-    fid.write(np.array(header['tiltangles'], dtype=np.float32).tobytes())
-    fid.write(np.array(header['xorg'], dtype=np.float32).tobytes())
-    fid.write(np.array(header['yorg'], dtype=np.float32).tobytes())
-    fid.write(np.array(header['zorg'], dtype=np.float32).tobytes())
+    fid.write(sg_mrc_header_to_bytes(header))
+    
+    return fid
+
+
+def sg_mrc_header_to_bytes(header, endian='<', buffer=None):
+    '''
+    Pack a header dictionary into 1024 bytes.
+    
+    Parameters:
+    header: Dictionary of header information
+    endian: Byte order of the packed header, '<' or '>'
+    buffer: Optional existing 1024-byte header. Bytes that are not part of the
+        header dictionary (e.g. exttyp and reserved fields) are kept.
+    Return:
+    bytes of the packed header
+    '''
+    dtype = sg_mrc_header_dtype.sg_mrc_header_dtype(endian)
+    if buffer is None:
+        raw = np.zeros(1, dtype=dtype)
+    else:
+        raw = np.frombuffer(buffer, dtype=dtype, count=1).copy()
+    
+    for name in ['nx', 'ny', 'nz', 'mode',
+                 'nxstart', 'nystart', 'nzstart',
+                 'mx', 'my', 'mz',
+                 'xlen', 'ylen', 'zlen',
+                 'alpha', 'beta', 'gamma',
+                 'mapc', 'mapr', 'maps',
+                 'amin', 'amax', 'amean',
+                 'ispg', 'nsymbt', 'next', 'creatid',
+                 'nint', 'nreal',
+                 'idtype', 'lens', 'nd1', 'nd2', 'vd1', 'vd2',
+                 'tiltangles',
+                 'xorg', 'yorg', 'zorg',
+                 'rms', 'nlabl']:
+        raw[name] = header[name]
+    
     if isinstance(header['cmap'], str):
-        fid.write(header['cmap'].encode('ascii'))
+        raw['cmap'] = header['cmap'].encode('ascii')
     else:
-        fid.write(np.array(header['cmap'], dtype=np.int8).tobytes())
-    fid.write(np.array(header['stamp'], dtype=np.int8).tobytes())
-    fid.write(np.array(header['rms'], dtype=np.float32).tobytes())
-    fid.write(np.array(header['nlabl'], dtype=np.int32).tobytes())
-    fid.write(label.tobytes())
+        raw['cmap'] = np.array(header['cmap'], dtype=np.int8).tobytes()
+    
+    # Set the stamp to match the byte order
+    raw['stamp'] = np.array([68, 65, 0, 0] if endian == '<' else [17, 17, 0, 0], dtype=np.int8)
+    
+    # Labels (truncated to 80 characters)
+    raw['labl'] = b''
+    for i in range(header['nlabl']):
+        if len(header['labl'][i]) > 80:
+            header['labl'][i] = header['labl'][i][:80]
+        raw['labl'][0, i] = header['labl'][i].encode('ascii', errors='replace')
     
-    return fid
\ No newline at end of file
+    return raw.tobytes()
@@ -0,0 +1,67 @@
+import numpy as np
+
+
+def sg_mrc_header_dtype(endian='<'):
+    """
+    Return the numpy structured dtype of the 1024-byte MRC header.
+    
+    The field layout matches sg_fread_mrcheader and sg_fwrite_mrcheader, so a
+    whole header can be decoded or encoded with a single read or write.
+    
+    Parameters:
+    -----------
+    endian : str
+        Byte order, '<' for little-endian or '>' for big-endian
+        
+    Returns:
+    --------
+    dtype : numpy.dtype
+        Structured dtype with an itemsize of 1024 bytes
+    """
+    i2 = endian + 'i2'
+    i4 = endian + 'i4'
+    f4 = endian + 'f4'
+    
+    dtype = np.dtype([
+        ('nx', i4), ('ny', i4), ('nz', i4),
+        ('mode', i4),
+        ('nxstart', i4), ('nystart', i4), ('nzstart', i4),
+        ('mx', i4), ('my', i4), ('mz', i4),
+        ('xlen', f4), ('ylen', f4), ('zlen', f4),
+        ('alpha', f4), ('beta', f4), ('gamma', f4),
+        ('mapc', i4), ('mapr', i4), ('maps', i4),
+        ('amin', f4), ('amax', f4), ('amean', f4),
+        ('ispg', i2), ('nsymbt', i2),
+        ('next', i4),
+        ('creatid', i2),
+        ('extra1', 'u1', (6,)),
+        ('exttyp', 'S4'),
+        ('nversion', i4),
+        ('extra2', 'u1', (16,)),
+        ('nint', i2), ('nreal', i2),
+        ('extra3', 'u1', (28,)),
+        ('idtype', i2), ('lens', i2),
+        ('nd1', i2), ('nd2', i2),
+        ('vd1', i2), ('vd2', i2),
+        ('tiltangles', f4, (6,)),
+        ('xorg', f4), ('yorg', f4), ('zorg', f4),
+        ('cmap', 'S4'),
+        ('stamp', 'i1', (4,)),
+        ('rms', f4),
+        ('nlabl', i4),
+        ('labl', 'S80', (10,)),
+    ])
+    
+    return dtype
+
+
+def sg_mrc_stamp_endian(stamp):
+    """
+    Return the byte order ('<' or '>') encoded in an MRC machine stamp.
+    
+    The first stamp byte is 0x44 (68) for little-endian and 0x11 (17) for
+    big-endian files. Unknown stamps are treated as little-endian.
+    """
+    if int(np.asarray(stamp).view(np.uint8)[0]) == 0x11:
+        return '>'
+    return '<'
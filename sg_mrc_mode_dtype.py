@@ -0,0 +1,69 @@
+import numpy as np
+
+# MRC data modes and their pixel types. Mode 101 is stored as packed 4-bit
+# values (two pixels per byte) and is unpacked to uint8.
+mrc_mode_dtypes = {
+    0: np.int8,
+    1: np.int16,
+    2: np.float32,
+    6: np.uint16,
+    12: np.float16,
+    101: np.uint8,
+}
+
+
+def sg_mrc_mode_dtype(mode):
+    """
+    Return the numpy dtype of the pixels stored in an MRC file of a given mode.
+    
+    Parameters:
+    -----------
+    mode : int
+        MRC data mode from the header
+        
+    Returns:
+    --------
+    dtype : numpy.dtype
+        Pixel data type
+    """
+    mode = int(mode)
+    if mode not in mrc_mode_dtypes:
+        raise ValueError(f"ACHTUNG!!! Unsupported MRC mode: {mode}!!! Supported modes are {sorted(mrc_mode_dtypes)}!!!")
+    
+    return np.dtype(mrc_mode_dtypes[mode])
+
+
+def sg_mrc_section_bytes(mode, nx, ny):
+    """
+    Return the number of bytes of one nx-by-ny section on disk. Rows of mode
+    101 data are padded to a whole number of bytes.
+    """
+    if int(mode) == 101:
+        return ((int(nx) + 1) // 2) * int(ny)
+    
+    return int(nx) * int(ny) * sg_mrc_mode_dtype(mode).itemsize
+
+
+def sg_mrc_unpack_4bit(packed, nx):
+    """
+    Unpack mode 101 data of shape (..., (nx + 1) // 2) into uint8 values of
+    shape (..., nx). The first pixel of each pair is in the low nibble.
+    """
+    unpacked = np.empty(packed.shape[:-1] + (2 * packed.shape[-1],), dtype=np.uint8)
+    unpacked[..., 0::2] = packed & 0x0F
+    unpacked[..., 1::2] = packed >> 4
+    
+    return unpacked[..., :nx]
+
+
+def sg_mrc_pack_4bit(data):
+    """
+    Pack uint8 values of shape (..., nx) into mode 101 bytes of shape
+    (..., (nx + 1) // 2). Values are clipped to 0-15.
+    """
+    nx = data.shape[-1]
+    values = np.clip(data, 0, 15).astype(np.uint8)
+    if nx % 2:
+        values = np.concatenate([values, np.zeros(values.shape[:-1] + (1,), dtype=np.uint8)], axis=-1)
+    
+    return values[..., 0::2] | (values[..., 1::2] << 4)
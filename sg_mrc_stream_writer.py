@@ -0,0 +1,161 @@
+import os
+import numpy as np
+import sg_generate_mrc_header as generate
+import sg_update_mrc_header as update
+import sg_fwrite_mrcheader as fwrite
+import sg_mrc_mode_dtype as sg_mrc_mode_dtype
+
+
+class sg_mrc_stream_writer:
+    """
+    Appendable MRC writer for streaming stacks to disk one tilt or chunk at a time.
+
+    Sections are appended with MATLAB-style axis order, i.e. a 2D (x, y) image
+    or a 3D (x, y, k) chunk of k sections. Image statistics (amin, amax, amean,
+    rms) are accumulated as data is written, and the final nz and statistics
+    are patched into the header on close, so the full stack never has to be
+    held in memory. If the with block exits with an exception, the partially
+    written file is deleted instead.
+
+    Usage:
+        with sg_mrc_stream_writer(mrc_name, header, pixelsize=p) as writer:
+            for img in images:
+                writer.append(img)
+
+    Parameters:
+    -----------
+    mrc_name : str
+        Path of the output MRC file
+    header : dict, optional
+        Header to start from (default: sg_generate_mrc_header)
+    mode : int, optional
+        Output MRC mode (0, 1, 2, 6, 12 or packed 4-bit 101). By default it is
+        derived from the data type of the first appended chunk.
+    **kwargs :
+        Header fields and 'pixelsize', as accepted by sg_update_mrc_header
+    """
+
+    def __init__(self, mrc_name, header=None, mode=None, **kwargs):
+
+        if header is None:
+            header = generate.sg_generate_mrc_header()
+
+        try:
+            self.fid = open(mrc_name, 'wb')
+        except:
+            raise IOError(f"ACHTUNG!!! Error opening file: {mrc_name}!!!")
+
+        self.mrc_name = mrc_name
+        self.header = dict(header)
+        self.mode = mode
+        self.kwargs = kwargs
+        self.dtype = None
+        self.nx = None
+        self.ny = None
+        self.nz = 0
+
+        # Running statistics
+        self.amin = np.inf
+        self.amax = -np.inf
+        self.sum = 0.0
+        self.sum_sq = 0.0
+
+        # Reserve space for the header; it is rewritten on close
+        self.fid.write(bytes(1024))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # A partially written stack must not look complete
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def append(self, data):
+        """
+        Append a 2D (x, y) section or a 3D (x, y, k) chunk of sections.
+        """
+        data = np.asarray(data)
+        if data.ndim == 1:
+            data = data.reshape(-1, 1)
+        if data.ndim == 2:
+            data = data[:, :, np.newaxis]
+        elif data.ndim != 3:
+            raise ValueError("ACHTUNG!!! Only 2D or 3D data can be appended to an MRC stack!!!")
+
+        # Initialize header from the first chunk
+        if self.dtype is None:
+            self._initialize(data)
+        elif (data.shape[0] != self.nx) or (data.shape[1] != self.ny):
+            raise ValueError(f"ACHTUNG!!! Section size {data.shape[:2]} does not match stack size ({self.nx}, {self.ny})!!!")
+
+        # Reorder to (z, y, x) so that x is fastest on disk; only this chunk is copied
+        out = data.transpose(2, 1, 0)
+        if self.header['mode'] == 101:
+            out = np.ascontiguousarray(np.clip(out, 0, 15), dtype=self.dtype)
+            self.fid.write(memoryview(sg_mrc_mode_dtype.sg_mrc_pack_4bit(out)).cast('B'))
+        else:
+            out = np.ascontiguousarray(out, dtype=self.dtype)
+            self.fid.write(memoryview(out).cast('B'))
+
+        # Update statistics
+        self.amin = min(self.amin, float(out.min()))
+        self.amax = max(self.amax, float(out.max()))
+        self.sum += float(np.sum(out, dtype=np.float64))
+        self.sum_sq += float(np.sum(np.square(out, dtype=np.float64)))
+        self.nz += data.shape[2]
+
+    def close(self):
+        """
+        Patch nz and the image statistics into the header and close the file.
+        """
+        if self.fid is None:
+            return
+
+        if self.dtype is not None:
+            n = float(self.nx * self.ny * self.nz)
+            mean = self.sum / n
+
+            self.header['nz'] = self.nz
+            self.header['mz'] = self.nz
+            self.header['zlen'] = self.nz * self.pixelsize_z
+            self.header['amin'] = self.amin
+            self.header['amax'] = self.amax
+            self.header['amean'] = mean
+            self.header['rms'] = np.sqrt(max(self.sum_sq / n - mean ** 2, 0.0))
+
+            self.fid.seek(0, 0)
+            fwrite.sg_fwrite_mrcheader(self.fid, self.header)
+
+        self.fid.close()
+        self.fid = None
+
+    def abort(self):
+        """
+        Close the file without finalizing the header and delete it.
+        """
+        if self.fid is None:
+            return
+
+        self.fid.close()
+        self.fid = None
+        if os.path.exists(self.mrc_name):
+            os.remove(self.mrc_name)
+
+    def _initialize(self, data):
+
+        if self.mode is not None:
+            self.kwargs['mode'] = self.mode
+        self.header = update.sg_update_mrc_header(data, self.header, compute_stats=False, **self.kwargs)
+        self.pixelsize_z = self.header['zlen'] / float(self.header['mz'])
+
+        self.dtype = sg_mrc_mode_dtype.sg_mrc_mode_dtype(self.header['mode']).newbyteorder('<')
+
+        # No extended header is written
+        self.header['next'] = 0
+        self.header['nsymbt'] = 0
+
+        self.nx = data.shape[0]
+        self.ny = data.shape[1]
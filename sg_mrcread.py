@@ -1,38 +1,53 @@
 import numpy as np
 import os
-import struct
-import sys
 import sg_fread_mrcheader as fread
-def sg_mrcread(mrc_name):
+import sg_mrc_mode_dtype as sg_mrc_mode_dtype
+import sg_mrc_header_dtype as sg_mrc_header_dtype
+def sg_mrcread(mrc_name, mmap_mode='r'):
     """
-    Read the MRC file and return the data and header information
+    Read the MRC file and return the data and header information.
+    
+    The data is returned as a memory-mapped view with MATLAB-style axis order
+    (x, y, z), so indexing a single slice (e.g. data[:, :, k]) only pages in
+    that slice from disk. Set mmap_mode to None to load the whole file into
+    memory instead. Packed 4-bit data (mode 101) is always unpacked to uint8
+    in memory.
+    
     Parameter:
     mrc_name: The path of the MRC file
+    mmap_mode: Memory-map mode passed to np.memmap ('r', 'r+', 'c'), or None to read into memory
     Return:
-    data: Array of image data
+    data: Array of image data, shape (nx, ny, nz)
     header: Dictionary of header information
 
     """
     
-    is_little_endian = (sys.byteorder == 'little')
-    
     with open(mrc_name, 'rb') as fid:
         # Read the header information
-        fid,header = fread.sg_fread_mrcheader(fid)
-        
-        fid.seek(1024 + header['next'], 0) 
-        
-        # reading data
-        n_pixels = header['nx'] * header['ny'] * header['nz']
-        
-        if header['mode'] == 0:
-            data = np.fromfile(fid, dtype=np.int8, count=n_pixels)
-        elif header['mode'] == 1:
-            data = np.fromfile(fid, dtype=np.int16, count=n_pixels)
-        elif header['mode'] == 2:
-            data = np.fromfile(fid, dtype=np.float32, count=n_pixels)
-        
-        # Reshape the data
-        data = data.reshape((header['nx'], header['ny'], header['nz']))
-        
-    return data, header
\ No newline at end of file
+        fid, header = fread.sg_fread_mrcheader(fid)
+    
+    nx, ny, nz = int(header['nx']), int(header['ny']), int(header['nz'])
+    endian = sg_mrc_header_dtype.sg_mrc_stamp_endian(header['stamp'])
+    dtype = sg_mrc_mode_dtype.sg_mrc_mode_dtype(header['mode']).newbyteorder(endian)
+    offset = 1024 + int(header['next'])
+    
+    # Check that the file holds all declared sections
+    n_bytes = sg_mrc_mode_dtype.sg_mrc_section_bytes(header['mode'], nx, ny) * nz
+    if os.path.getsize(mrc_name) < offset + n_bytes:
+        raise IOError(f"ACHTUNG!!! {mrc_name} is smaller than its header declares!!!")
+    
+    if int(header['mode']) == 101:
+        # Packed 4-bit data has no element-wise view, so it is unpacked into memory
+        packed = np.memmap(mrc_name, dtype=np.uint8, mode='r', offset=offset, shape=(nz, ny, (nx + 1) // 2))
+        data = sg_mrc_mode_dtype.sg_mrc_unpack_4bit(packed, nx)
+    # Data is stored with x fastest, so map it as (z, y, x) and transpose to a (x, y, z) view
+    elif mmap_mode is None:
+        with open(mrc_name, 'rb') as fid:
+            fid.seek(offset, 0)
+            data = np.fromfile(fid, dtype=dtype, count=nx * ny * nz)
+        data = data.reshape((nz, ny, nx))
+    else:
+        data = np.memmap(mrc_name, dtype=dtype, mode=mmap_mode, offset=offset, shape=(nz, ny, nx))
+    data = data.transpose(2, 1, 0)
+    
+    return data, header
@@ -0,0 +1,51 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import sg_mrcread as sg_mrcread
+import sg_read_mrc_header as sg_read_mrc_header
+
+
+def sg_mrcread_many(mrc_names, dtype=np.float32, n_workers=8):
+    """
+    Read a list of same-sized MRC files into one stack.
+
+    Files are read concurrently with a thread pool, each directly into its
+    slot of a single preallocated array. The header of the first file defines
+    the expected size and mode; every other file is checked against it.
+
+    Parameters:
+    -----------
+    mrc_names : list of str
+        Paths of the MRC files, in stack order
+    dtype : numpy dtype
+        Data type of the output stack
+    n_workers : int
+        Number of threads used for reading
+
+    Returns:
+    --------
+    stack : ndarray
+        Stack of shape (nx, ny, nz * len(mrc_names)), indexed (x, y, z)
+    header : dict
+        Header of the first file
+    """
+    if len(mrc_names) == 0:
+        raise ValueError("ACHTUNG!!! No MRC files given!!!")
+
+    # Reference header
+    header = sg_read_mrc_header.sg_read_mrc_header(mrc_names[0])
+    nx, ny, nz = int(header['nx']), int(header['ny']), int(header['nz'])
+
+    # Fortran order keeps each section contiguous
+    stack = np.empty((nx, ny, nz * len(mrc_names)), dtype=dtype, order='F')
+
+    def read_file(i):
+        data, temp_header = sg_mrcread.sg_mrcread(mrc_names[i])
+        if data.shape != (nx, ny, nz) or temp_header['mode'] != header['mode']:
+            raise ValueError(f"ACHTUNG!!! {mrc_names[i]} has size {data.shape} and mode {temp_header['mode']}, but ({nx}, {ny}, {nz}) and mode {header['mode']} were expected!!!")
+        stack[:, :, i * nz:(i + 1) * nz] = data
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        # list() re-raises any read errors
+        list(executor.map(read_file, range(len(mrc_names))))
+
+    return stack, header
@@ -1,29 +1,15 @@
-import numpy as np
-import os
-import sg_generate_mrc_header as generate
-import sg_update_mrc_header as update
-import sg_fwrite_mrcheader as fwrite
+import sg_mrc_stream_writer as sg_mrc_stream_writer
 def sg_mrcwrite(mrc_name, data, header=None, **kwargs):
-
-
-    if header is None:
-        header = generate.sg_generate_mrc_header()
-    
-    try:
-        fid = open(mrc_name, 'wb')
-    except:
-        raise IOError(f"ACHTUNG!!! Error opening file: {mrc_name}!!!")
-    
-    header = update.sg_update_mrc_header(data, header, **kwargs)
-    
-    fwrite.sg_fwrite_mrcheader(fid, header)
-    
-    data_flat = data.flatten()
-    if header['mode'] == 0:
-        fid.write(data_flat.astype(np.int8).tobytes())
-    elif header['mode'] == 1:
-        fid.write(data_flat.astype(np.int16).tobytes())
-    elif header['mode'] == 2:
-        fid.write(data_flat.astype(np.float32).tobytes())
-    
-    fid.close()
\ No newline at end of file
+    '''
+    Write data, indexed (x, y, z), to an MRC file.
+    
+    Sections are streamed to disk one at a time through sg_mrc_stream_writer,
+    so no flattened or type-converted copy of the full volume is made.
+    '''
+    
+    with sg_mrc_stream_writer.sg_mrc_stream_writer(mrc_name, header, **kwargs) as writer:
+        if data.ndim == 3:
+            for i in range(data.shape[2]):
+                writer.append(data[:, :, i])
+        else:
+            writer.append(data)
@@ -0,0 +1,121 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import sg_fread_mrcheader as fread
+import sg_fwrite_mrcheader as fwrite
+import sg_default_mrc_header_fields as default
+import sg_append_mrc_label_enhanced as sg_append_mrc_label_enhanced
+import sg_mrc_header_dtype as sg_mrc_header_dtype
+import sg_mrc_mode_dtype as sg_mrc_mode_dtype
+
+
+def sg_patch_mrc_header(mrc_name, header_fn=None, label=None, pixelsize=None, **kwargs):
+    """
+    Update the header of an MRC file in place, without rewriting pixel data.
+
+    Only the 1024-byte header is rewritten, with a single write at the start
+    of the file followed by an fsync. The original byte order and any header
+    bytes not covered by the header dictionary (e.g. exttyp) are kept. The
+    update is refused if the patched header would declare more data than the
+    file holds.
+
+    Parameters:
+    -----------
+    mrc_name : str
+        Path of the MRC file
+    header_fn : callable, optional
+        Function taking and returning the header dictionary, for arbitrary edits
+    label : str, optional
+        Label to append with sg_append_mrc_label
+    pixelsize : float or list, optional
+        New pixel size in Angstroms (1, 2 or 3 values)
+    **kwargs :
+        Header fields to set (e.g. mapc=1, mapr=2, maps=3)
+
+    Returns:
+    --------
+    header : dict
+        The patched header
+    """
+    # Check field names
+    header_fields = [field[0] for field in default.sg_default_mrc_header_fields()]
+    for key in kwargs:
+        if key not in header_fields:
+            raise ValueError(f"ACHTUNG!!! Invalid input argument: {key}!!!")
+
+    with open(mrc_name, 'r+b') as fid:
+        buffer = fid.read(1024)
+        if len(buffer) != 1024:
+            raise IOError(f"ACHTUNG!!! MRC header of {mrc_name} is truncated!!!")
+        header = fread.sg_mrc_header_from_bytes(buffer)
+        endian = sg_mrc_header_dtype.sg_mrc_stamp_endian(header['stamp'])
+
+        # Apply updates
+        for key, value in kwargs.items():
+            header[key] = value
+
+        if pixelsize is not None:
+            if isinstance(pixelsize, (int, float)):
+                pixelsize = [pixelsize] * 3
+            elif len(pixelsize) == 2:
+                pixelsize = [pixelsize[0], pixelsize[1], 1]
+            elif len(pixelsize) != 3:
+                raise ValueError("ACHTUNG!!! Pixel size must be given with either 1, 2, or 3 dimensions!!!")
+            header['xlen'] = header['mx'] * pixelsize[0]
+            header['ylen'] = header['my'] * pixelsize[1]
+            header['zlen'] = header['mz'] * pixelsize[2]
+
+        if label is not None:
+            header = sg_append_mrc_label_enhanced.sg_append_mrc_label(header, label)
+
+        if header_fn is not None:
+            header = header_fn(header)
+
+        # Check that the patched header still describes the file
+        n_bytes = 1024 + int(header['next']) + sg_mrc_mode_dtype.sg_mrc_section_bytes(header['mode'], header['nx'], header['ny']) * int(header['nz'])
+        if n_bytes > os.fstat(fid.fileno()).st_size:
+            raise ValueError(f"ACHTUNG!!! Patched header of {mrc_name} declares more data than the file holds!!!")
+
+        # Write the new header in one call
+        new_buffer = fwrite.sg_mrc_header_to_bytes(header, endian=endian, buffer=buffer)
+        os.pwrite(fid.fileno(), new_buffer, 0)
+        os.fsync(fid.fileno())
+
+    return header
+
+
+def sg_patch_mrc_headers(mrc_names, n_workers=16, **kwargs):
+    """
+    Patch the headers of many MRC files in place with a thread pool.
+
+    Parameters:
+    -----------
+    mrc_names : list of str or dict
+        Paths of the MRC files, or a catalog from tomoman_mrc_catalog
+    n_workers : int
+        Number of threads
+    **kwargs :
+        Arguments passed to sg_patch_mrc_header
+
+    Returns:
+    --------
+    failed : list of str
+        Paths that could not be patched
+    """
+    if isinstance(mrc_names, dict):
+        mrc_names = list(mrc_names['path'])
+
+    def patch(mrc_name):
+        try:
+            sg_patch_mrc_header(mrc_name, **kwargs)
+        except Exception as e:
+            print(f"ACHTUNG!!! Could not patch header of {mrc_name}: {e}")
+            return mrc_name
+        return None
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        results = list(executor.map(patch, mrc_names))
+
+    failed = [name for name in results if name is not None]
+    print(f"TOMOMAN: {len(mrc_names) - len(failed)} of {len(mrc_names)} MRC headers patched...")
+
+    return failed
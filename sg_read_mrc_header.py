@@ -1,12 +1,11 @@
-import os
-import sys
-import struct
-import numpy as np
 import sg_fread_mrcheader as sg_fread_mrcheader
 def sg_read_mrc_header(mrc_name):
     """
     Read and return a .mrc header as a dictionary.
     
+    Only the 1024-byte header is read; the byte order is taken from the
+    machine stamp in the header.
+    
     Parameters:
     -----------
     mrc_name : str
@@ -17,15 +16,9 @@ def sg_read_mrc_header(mrc_name):
     header : dict
         MRC header information
     """
-    # Check computer type (endianness)
-    if sys.byteorder == 'little':
-        endian = '<'  # little-endian
-    else:
-        endian = '>'  # big-endian
-    
     # Open file
     with open(mrc_name, 'rb') as fid:
         # Read header using helper function
-        header = sg_fread_mrcheader.sg_fread_mrcheader(fid, endian)
+        fid, header = sg_fread_mrcheader.sg_fread_mrcheader(fid)
     
-    return header
\ No newline at end of file
+    return header
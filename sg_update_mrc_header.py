@@ -1,13 +1,21 @@
 import sg_default_mrc_header_fields as default
+import sg_generate_mrc_header as generate
+import sg_mrc_mode_dtype as sg_mrc_mode_dtype
 import numpy as np
-def sg_update_mrc_header(data, header=None, **kwargs):
+def sg_update_mrc_header(data, header=None, compute_stats=True, **kwargs):
+    '''
+    Update the MRC header to match the data and any header fields given as
+    keyword arguments. Set compute_stats to False to skip the passes over the
+    data for amin/amax/amean (e.g. when the statistics are accumulated while
+    streaming the data to disk).
+    '''
     
     # Initialize the default header field
     header_fields = default.sg_default_mrc_header_fields()
     
     # Check the input header information
     if header is None:
-        header = default.sg_generate_mrc_header(header_fields)
+        header = generate.sg_generate_mrc_header(header_fields)
     
     # Non-header information input
     non_header = ['pixelsize']
@@ -61,17 +69,26 @@ def sg_update_mrc_header(data, header=None, **kwargs):
     header['ylen'] = y * pixelsize[1]
     header['zlen'] = z * pixelsize[2]
     
-    header['amin'] = float(np.min(data))
-    header['amax'] = float(np.max(data))
-    header['amean'] = float(np.mean(data))
+    if compute_stats:
+        header['amin'] = float(np.min(data))
+        header['amax'] = float(np.max(data))
+        header['amean'] = float(np.mean(data))
     
-    if data.dtype == np.int8:
+    if 'mode' in kwargs:
+        # Explicit output mode (data is converted when written)
+        sg_mrc_mode_dtype.sg_mrc_mode_dtype(kwargs['mode'])
+        header['mode'] = int(kwargs['mode'])
+    elif data.dtype == np.int8:
         header['mode'] = 0
     elif data.dtype == np.int16:
         header['mode'] = 1
     elif data.dtype in [np.float32, np.float64]:
         header['mode'] = 2
+    elif data.dtype == np.uint16:
+        header['mode'] = 6
+    elif data.dtype == np.float16:
+        header['mode'] = 12
     else:
-        raise ValueError("ACHTUNG!!! Input data has unsupported data type!!! Only 'int8', 'int16', and 'float' supported!!!")
+        raise ValueError("ACHTUNG!!! Input data has unsupported data type!!! Only 'int8', 'int16', 'uint16', 'float16', and 'float' supported!!!")
     
     return header
\ No newline at end of file
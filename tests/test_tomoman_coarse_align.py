@@ -0,0 +1,36 @@
+import os
+import sys
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sg_generate_mrc_header as sg_generate_mrc_header
+import sg_mrcwrite as sg_mrcwrite
+import tomoman_apply_xf as tomoman_apply_xf
+import tomoman_coarse_align as tomoman_coarse_align
+
+
+def test_coarse_align_high_tilt_shift(tmp_path):
+    # A 54 degree tilt, foreshortened and shifted by 10 pixels, next to a 3 degree reference
+    rng = np.random.default_rng(0)
+    n = 256
+    base = gaussian_filter(rng.random((n, n)), 2).astype(np.float32)
+    angles = np.array([3.0, 54.0])
+    stretch = np.cos(np.deg2rad(angles[1])) / np.cos(np.deg2rad(angles[0]))
+
+    stack = np.zeros((n, n, 2), dtype=np.float32)
+    stack[:, :, 0] = base
+    stack[:, :, 1] = tomoman_apply_xf.tomoman_transform_image(base, [stretch, 0, 0, 1, 10, 0])
+
+    stack_name = str(tmp_path / 'stack.mrc')
+    tlt_name = str(tmp_path / 'stack.rawtlt')
+    sg_mrcwrite.sg_mrcwrite(stack_name, stack, sg_generate_mrc_header.sg_generate_mrc_header(), pixelsize=1.0)
+    np.savetxt(tlt_name, angles)
+
+    tomoman_coarse_align.tomoman_coarse_align(stack_name, tlt_name, str(tmp_path / 'stack.prexf'), binning=1,
+                                              prexg_name=str(tmp_path / 'stack.prexg'), n_workers=1)
+
+    prexg = np.loadtxt(str(tmp_path / 'stack.prexg'))
+    np.testing.assert_allclose(prexg[0, 4:], [0, 0], atol=1e-6)
+    np.testing.assert_allclose(prexg[1, 4:], [-10, 0], atol=0.5)
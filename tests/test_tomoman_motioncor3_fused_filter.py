@@ -0,0 +1,62 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+pytest.importorskip('skimage')
+
+import sg_generate_mrc_header as sg_generate_mrc_header
+import sg_mrcread as sg_mrcread
+import sg_mrcwrite as sg_mrcwrite
+import tomoman_exposure_filter as tomoman_exposure_filter
+import tomoman_motioncor3_newstack_modi_GQ as tomoman_motioncor3_newstack_modi_GQ
+
+
+def run_newstack(tmp_path, monkeypatch, tilt_order, filter_frames):
+    # Aligned images stand in for MotionCor3, one per collected tilt
+    rng = np.random.default_rng(0)
+    tilts = [0, 3, -3, 6, -6]
+    images = [rng.random((32, 24)).astype(np.float32) for _ in tilts]
+
+    def fake_motioncor3(input_names, output_names, tomolist, mc3):
+        for image, name in zip(images, output_names):
+            sg_mrcwrite.sg_mrcwrite(name, image[:, :, np.newaxis], sg_generate_mrc_header.sg_generate_mrc_header())
+
+    monkeypatch.setattr(tomoman_motioncor3_newstack_modi_GQ.wrapper, 'tomoman_motioncor3_batch_wrapper_modi_GQ', fake_motioncor3)
+
+    stack_dir = str(tmp_path) + '/'
+    tomolist = dict(skip=False, frames_aligned=False, tomo_num=1, collected_tilts=tilts, removed_tilts=[], rawtlt=sorted(tilts),
+                    stack_dir=stack_dir, frame_dir=stack_dir, frame_names=['frames.tif'] * len(tilts), pixelsize=1.5,
+                    mirror_stack='none', dose=[3, 6, 9, 12, 15], cumulative_exposure_time=[1, 2, 3, 4, 5],
+                    dose_filtered=False)
+    p = dict(digits=3, prefix='tomo_', root_dir=stack_dir, tomolist_name='tomolist.mat')
+    a = dict(stack_prefix=0, image_size=[32, 24], tilt_order=tilt_order)
+    mc3 = dict(force_realign=0, dose_filter=0, fused_dose_filter=1)
+    df = dict(a=None, b=None, c=None, preexposure=1, dfilt_append='_df', filter_frames=filter_frames,
+              force_dfilt=1, n_workers=1, output_mode=2)
+
+    tomolist = tomoman_motioncor3_newstack_modi_GQ.tomoman_motioncor3_newstack_modi_GQ(tomolist, p, a, mc3, False, df)
+    return tomolist, p, df
+
+
+@pytest.mark.parametrize('tilt_order', ['ascend', 'descend'])
+def test_fused_filter_matches_exposure_filter(tmp_path, monkeypatch, tilt_order):
+    tomolist, p, df = run_newstack(tmp_path, monkeypatch, tilt_order, 0)
+    assert tomolist['dose_filtered']
+    fused_name = os.path.join(tomolist['stack_dir'], tomolist['dose_filtered_stack_name'])
+    os.rename(fused_name, fused_name + '.fused')
+
+    # The new stack is always written in ascending tilt order
+    tomoman_exposure_filter.tomoman_exposure_filter(dict(tomolist, dose_filtered=False), p, dict(tilt_order='ascend'), df, False)
+
+    fused = sg_mrcread.sg_mrcread(fused_name + '.fused')[0]
+    filtered = sg_mrcread.sg_mrcread(fused_name)[0]
+    np.testing.assert_allclose(fused, filtered, rtol=1e-5, atol=1e-6)
+
+
+def test_fused_filter_skipped_for_frame_filtering(tmp_path, monkeypatch):
+    tomolist, p, df = run_newstack(tmp_path, monkeypatch, 'ascend', 1)
+    assert not tomolist.get('dose_filtered')
+    assert not os.path.exists(os.path.join(tomolist['stack_dir'], '001_df.st'))
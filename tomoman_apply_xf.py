@@ -0,0 +1,150 @@
+import shutil
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from scipy.ndimage import affine_transform
+import sg_mrcread as sg_mrcread
+import sg_generate_mrc_header as sg_generate_mrc_header
+import sg_append_mrc_label_enhanced as sg_append_mrc_label_enhanced
+import sg_mrc_stream_writer as sg_mrc_stream_writer
+import tomoman_bin_stack as tomoman_bin_stack
+import tomoman_precision as tomoman_precision
+
+
+def tomoman_read_xf(xf_name):
+    """
+    Read an IMOD .xf file.
+
+    Parameters:
+    -----------
+    xf_name : str
+        Path of the .xf file
+
+    Returns:
+    --------
+    xf : ndarray
+        Array of shape (n_tilts, 6) with A11 A12 A21 A22 DX DY per tilt
+    """
+    xf = np.loadtxt(xf_name, ndmin=2)
+    if xf.shape[1] != 6:
+        raise ValueError(f"ACHTUNG!!! {xf_name} is not a valid .xf file!!!")
+    return xf
+
+
+def tomoman_transform_image(image, xf_line, binning=1, out_size=None, order=1, method='fourier'):
+    """
+    Apply an IMOD 2D transform to an image, optionally binning it first.
+
+    As in IMOD, the transform maps centered input coordinates to centered
+    output coordinates, x' = A * x + D, with the center at (n/2, n/2) in
+    pixel-edge coordinates. The image is binned before it is transformed,
+    and the shifts are scaled accordingly. Areas outside the input are
+    filled with the image mean.
+
+    Parameters:
+    -----------
+    image : ndarray
+        Input image (x, y)
+    xf_line : array_like
+        A11 A12 A21 A22 DX DY
+    binning : int
+        Binning factor
+    out_size : tuple, optional
+        Output size (x, y) after binning (default: binned input size)
+    order : int
+        Spline interpolation order (1 = linear, 3 = cubic)
+    method : str
+        Binning method, 'fourier' or 'block'
+
+    Returns:
+    --------
+    ali_img : ndarray
+        Transformed image
+    """
+    image = tomoman_bin_stack.tomoman_bin_image(image, binning, method)
+    image = np.asarray(image, dtype=tomoman_precision.tomoman_real_dtype())
+    in_size = np.array(image.shape, dtype=float)
+    out_size = tuple(image.shape) if out_size is None else tuple(int(n) for n in out_size)
+
+    # Inverse transform from output to input pixel indices
+    a = np.array(xf_line[:4], dtype=float).reshape(2, 2)
+    d = np.array(xf_line[4:6], dtype=float) / binning
+    a_inv = np.linalg.inv(a)
+    offset = a_inv @ (0.5 - np.array(out_size, dtype=float) / 2 - d) + in_size / 2 - 0.5
+
+    return affine_transform(image, a_inv, offset=offset, output_shape=out_size, order=order, mode='constant', cval=float(image.mean()), prefilter=order > 1)
+
+
+def tomoman_apply_xf(stack_name, xf_name, output_name, binning=1, out_size=None, order=1, method='fourier', n_workers=8, tlt_name=None, mode=None):
+    """
+    Write an aligned, optionally binned, stack by applying the transforms in
+    an IMOD .xf file, as newstack -xform does.
+
+    The input is memory-mapped and tilts are transformed in parallel threads,
+    then streamed to the output in order.
+
+    Parameters:
+    -----------
+    stack_name : str
+        Path of the input MRC stack
+    xf_name : str
+        Path of the .xf file with one transform per tilt
+    output_name : str
+        Path of the aligned stack
+    binning : int
+        Binning factor of the aligned stack
+    out_size : tuple, optional
+        Output size (x, y) after binning (default: binned input size)
+    order : int
+        Spline interpolation order (1 = linear, 3 = cubic)
+    method : str
+        Binning method, 'fourier' or 'block'
+    n_workers : int
+        Number of threads
+    tlt_name : str, optional
+        Path of the .tlt file; it is checked against the stack and copied
+        next to the aligned stack
+    mode : int, optional
+        Output MRC mode (default: from the data type)
+
+    Returns:
+    --------
+    output_name : str
+        Path of the aligned stack
+    """
+    binning = int(binning)
+    stack, header = sg_mrcread.sg_mrcread(stack_name)
+    n_tilts = stack.shape[2]
+
+    xf = tomoman_read_xf(xf_name)
+    if xf.shape[0] != n_tilts:
+        raise ValueError(f"ACHTUNG!!! {xf_name} has {xf.shape[0]} transforms, but {stack_name} has {n_tilts} tilts!!!")
+
+    if tlt_name is not None:
+        tilts = np.loadtxt(tlt_name, ndmin=1)
+        if len(tilts) != n_tilts:
+            raise ValueError(f"ACHTUNG!!! {tlt_name} has {len(tilts)} tilt angles, but {stack_name} has {n_tilts} tilts!!!")
+
+    # Pixel size of the aligned stack
+    pixelsize = (header['xlen'] / header['mx'] if header['mx'] > 0 else 1.0) * binning
+
+    out_header = sg_generate_mrc_header.sg_generate_mrc_header()
+    out_header = sg_append_mrc_label_enhanced.sg_append_mrc_label(out_header, f"TOMOMAN: Transformed with {xf_name.split('/')[-1]}, binned by {binning}.")
+
+    def transform_tilt(i):
+        return tomoman_transform_image(stack[:, :, i], xf[i], binning, out_size, order, method)
+
+    print(f"TOMOMAN: Applying {xf_name} to {stack_name}...")
+    with sg_mrc_stream_writer.sg_mrc_stream_writer(output_name, out_header, mode=mode, pixelsize=pixelsize) as writer:
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            # Tilts are transformed in chunks to bound memory use
+            chunk = max(int(n_workers), 1) * 2
+            for start in range(0, n_tilts, chunk):
+                for img in executor.map(transform_tilt, range(start, min(start + chunk, n_tilts))):
+                    writer.append(img)
+
+    if tlt_name is not None:
+        out_tlt = output_name.rsplit('.', 1)[0] + '.tlt'
+        if out_tlt != tlt_name:
+            shutil.copyfile(tlt_name, out_tlt)
+
+    return output_name
@@ -0,0 +1,102 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import sg_mrcread as sg_mrcread
+import sg_generate_mrc_header as sg_generate_mrc_header
+import sg_append_mrc_label_enhanced as sg_append_mrc_label_enhanced
+import sg_mrc_stream_writer as sg_mrc_stream_writer
+import tomoman_fft as tomoman_fft
+import tomoman_precision as tomoman_precision
+
+
+def tomoman_bin_image(image, binning, method='fourier'):
+    """
+    Bin a 2D image by an integer factor.
+
+    Parameters:
+    -----------
+    image : ndarray
+        Input image (x, y)
+    binning : int
+        Binning factor
+    method : str
+        'fourier' for antialiased Fourier cropping, or 'block' for fast
+        real-space averaging of binning x binning blocks
+
+    Returns:
+    --------
+    binned_img : ndarray
+        Binned image (x // binning, y // binning)
+    """
+    binning = int(binning)
+    image = np.asarray(image, dtype=tomoman_precision.tomoman_real_dtype())
+    x, y = image.shape
+    new_shape = (x // binning, y // binning)
+
+    if binning == 1:
+        return image
+
+    if method == 'fourier':
+        spectrum = tomoman_fft.rfft2(image)
+        return tomoman_fft.irfft2(tomoman_fft.crop_rfft2(spectrum, (x, y), new_shape), new_shape)
+    elif method == 'block':
+        # Remainder rows and columns are dropped
+        blocks = image[:new_shape[0] * binning, :new_shape[1] * binning]
+        return blocks.reshape(new_shape[0], binning, new_shape[1], binning).mean(axis=(1, 3))
+    else:
+        raise ValueError(f"ACHTUNG!!! Invalid binning method: {method}!!! Options are 'fourier' and 'block'!!!")
+
+
+def tomoman_bin_stack(input_name, output_name, binning, method='fourier', n_workers=8, mode=None):
+    """
+    Bin an MRC stack by an integer factor.
+
+    The input is memory-mapped and binned tilt by tilt with a thread pool,
+    and binned tilts are streamed to the output in order, so at most a few
+    tilts per worker are held in memory.
+
+    Parameters:
+    -----------
+    input_name : str
+        Path of the input MRC stack
+    output_name : str
+        Path of the binned MRC stack
+    binning : int
+        Binning factor
+    method : str
+        'fourier' (antialiased) or 'block' (fast real-space averaging)
+    n_workers : int
+        Number of threads
+    mode : int, optional
+        Output MRC mode (default: from the binned data type)
+
+    Returns:
+    --------
+    output_name : str
+        Path of the binned MRC stack
+    """
+    binning = int(binning)
+    if binning < 1:
+        raise ValueError("ACHTUNG!!! Binning factor must be a positive integer!!!")
+
+    stack, header = sg_mrcread.sg_mrcread(input_name)
+    n_tilts = stack.shape[2]
+
+    # Pixel size of the binned stack
+    pixelsize = (header['xlen'] / header['mx'] if header['mx'] > 0 else 1.0) * binning
+
+    out_header = sg_generate_mrc_header.sg_generate_mrc_header()
+    out_header = sg_append_mrc_label_enhanced.sg_append_mrc_label(out_header, f"TOMOMAN: Binned by {binning} ({method}).")
+
+    def bin_tilt(i):
+        return tomoman_bin_image(stack[:, :, i], binning, method)
+
+    print(f"TOMOMAN: Binning {input_name} by {binning}...")
+    with sg_mrc_stream_writer.sg_mrc_stream_writer(output_name, out_header, mode=mode, pixelsize=pixelsize) as writer:
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            # Tilts are binned in chunks to bound memory use
+            chunk = max(int(n_workers), 1) * 2
+            for start in range(0, n_tilts, chunk):
+                for img in executor.map(bin_tilt, range(start, min(start + chunk, n_tilts))):
+                    writer.append(img)
+
+    return output_name
@@ -0,0 +1,198 @@
+import os
+import time
+import numpy as np
+import sg_read_mrc_header as sg_read_mrc_header
+import sg_mrc_mode_dtype as sg_mrc_mode_dtype
+
+# Byte sizes of TIFF field types
+tiff_type_sizes = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 16: 8, 17: 8, 18: 8}
+
+# TIFF tags holding data offsets and their byte counts (strips and tiles)
+tiff_data_tags = [(273, 279), (324, 325)]
+
+
+def tomoman_check_file_complete(file_name, state=None, stable_window=0, poll_interval=1.0):
+    """
+    Check whether a file is completely written, without reading pixel data.
+
+    MRC files are complete when the file is at least as large as its header
+    declares. TIFF and EER files are complete when every IFD and every strip
+    or tile they reference lies within the file. In addition, a file is only
+    considered complete once its size and mtime are stable: it must not have
+    been modified for stable_window seconds, and a file modified within the
+    last poll_interval seconds must keep its size and mtime over a second
+    poll poll_interval seconds later. If a state dictionary is given, the
+    size and mtime must also be unchanged since the previous check.
+
+    A stack SerialEM is still appending to passes the header and size checks
+    after every section it writes, so only the stability checks keep a
+    half-finished tilt series from being treated as complete. They cannot
+    tell a finished stack from one whose acquisition pauses for longer than
+    the window between sections (e.g. while tilting or tracking), so
+    stable_window should exceed the longest such pause.
+
+    Parameters:
+    -----------
+    file_name : str
+        Path of the file
+    state : dict, optional
+        Dictionary persisted by the caller between checks, mapping paths to
+        their last seen (size, mtime)
+    stable_window : float
+        Minimum time in seconds since the last modification
+    poll_interval : float
+        Time in seconds between the two polls of a recently modified file
+
+    Returns:
+    --------
+    complete : bool
+        True if the file exists and is completely written
+    """
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return False
+
+    # Stable size and mtime
+    age = time.time() - stat.st_mtime
+    if age < stable_window:
+        return False
+    stable = True
+    if age < poll_interval:
+        # Recently modified, poll again
+        time.sleep(poll_interval)
+        try:
+            new_stat = os.stat(file_name)
+        except OSError:
+            return False
+        stable = (new_stat.st_size, new_stat.st_mtime) == (stat.st_size, stat.st_mtime)
+        stat = new_stat
+    if state is not None:
+        previous = state.get(file_name)
+        state[file_name] = (stat.st_size, stat.st_mtime)
+        stable = stable and (previous == (stat.st_size, stat.st_mtime))
+    if not stable:
+        return False
+
+    # Format-specific checks
+    ext = os.path.splitext(file_name)[1].lower()
+    try:
+        if ext in ['.mrc', '.st', '.mrcs', '.ali', '.rec']:
+            return mrc_complete(file_name, stat.st_size)
+        elif ext in ['.tif', '.tiff', '.eer']:
+            return tiff_complete(file_name, stat.st_size)
+    except Exception as e:
+        print(f"ACHTUNG!!! Could not check {file_name}: {e}")
+        return False
+
+    return True
+
+
+def mrc_complete(file_name, file_size):
+    """
+    Compare the data size declared in the MRC header with the file size.
+    """
+    if file_size < 1024:
+        return False
+
+    header = sg_read_mrc_header.sg_read_mrc_header(file_name)
+    n_bytes = 1024 + int(header['next']) + sg_mrc_mode_dtype.sg_mrc_section_bytes(header['mode'], header['nx'], header['ny']) * int(header['nz'])
+
+    return file_size >= n_bytes
+
+
+def tiff_complete(file_name, file_size):
+    """
+    Walk the IFD chain of a classic or BigTIFF file (including EER) and check
+    that all IFDs and image data lie within the file.
+    """
+    with open(file_name, 'rb') as fid:
+        head = fid.read(16)
+        if len(head) < 8:
+            return False
+
+        if head[:2] == b'II':
+            endian = '<'
+        elif head[:2] == b'MM':
+            endian = '>'
+        else:
+            return False
+
+        magic = int(np.frombuffer(head, dtype=endian + 'u2', count=1, offset=2)[0])
+        if magic == 42:
+            big = False
+            ifd_offset = int(np.frombuffer(head, dtype=endian + 'u4', count=1, offset=4)[0])
+        elif magic == 43 and len(head) == 16:
+            big = True
+            ifd_offset = int(np.frombuffer(head, dtype=endian + 'u8', count=1, offset=8)[0])
+        else:
+            return False
+
+        # Layout of IFD entries
+        count_size, entry_size, next_size = (8, 20, 8) if big else (2, 12, 4)
+        entry_dtype = np.dtype([
+            ('tag', endian + 'u2'),
+            ('type', endian + 'u2'),
+            ('count', endian + ('u8' if big else 'u4')),
+            ('value', 'V8' if big else 'V4'),
+        ])
+
+        if ifd_offset == 0:
+            return False
+
+        visited = set()
+        while ifd_offset != 0:
+            if ifd_offset in visited or ifd_offset + count_size > file_size:
+                return False
+            visited.add(ifd_offset)
+
+            # Read IFD
+            fid.seek(ifd_offset, 0)
+            n_entries = int(np.frombuffer(fid.read(count_size), dtype=endian + ('u8' if big else 'u2'), count=1)[0])
+            ifd_size = n_entries * entry_size + next_size
+            if ifd_offset + count_size + ifd_size > file_size:
+                return False
+            buffer = fid.read(ifd_size)
+            entries = np.frombuffer(buffer, dtype=entry_dtype, count=n_entries)
+            ifd_offset = int(np.frombuffer(buffer, dtype=endian + ('u8' if big else 'u4'), count=1, offset=n_entries * entry_size)[0])
+
+            # Check image data of this IFD
+            for offset_tag, count_tag in tiff_data_tags:
+                offsets = tiff_entry_values(fid, entries, offset_tag, endian, file_size)
+                counts = tiff_entry_values(fid, entries, count_tag, endian, file_size)
+                if offsets is None or counts is None:
+                    continue
+                if len(offsets) != len(counts) or np.any(offsets + counts > file_size):
+                    return False
+
+    return True
+
+
+def tiff_entry_values(fid, entries, tag, endian, file_size):
+    """
+    Return the integer values of a TIFF tag, reading them from the file if
+    they are not stored inline in the entry.
+    """
+    idx = np.nonzero(entries['tag'] == tag)[0]
+    if len(idx) == 0:
+        return None
+    entry = entries[idx[0]]
+
+    field_type = int(entry['type'])
+    if field_type not in [3, 4, 16]:
+        return None
+    dtype = np.dtype(endian + {3: 'u2', 4: 'u4', 16: 'u8'}[field_type])
+    count = int(entry['count'])
+    n_bytes = count * tiff_type_sizes[field_type]
+
+    value = bytes(entry['value'])
+    if n_bytes <= len(value):
+        # Values stored inline
+        return np.frombuffer(value, dtype=dtype, count=count).astype(np.int64)
+
+    offset = int(np.frombuffer(value, dtype=endian + ('u8' if len(value) == 8 else 'u4'), count=1)[0])
+    if offset + n_bytes > file_size:
+        return np.array([file_size + 1], dtype=np.int64)
+    fid.seek(offset, 0)
+
+    return np.frombuffer(fid.read(n_bytes), dtype=dtype, count=count).astype(np.int64)
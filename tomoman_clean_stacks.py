@@ -1,6 +1,8 @@
 import os
 import numpy as np
 import subprocess
+import tomoman_bin_stack as tomoman_bin_stack
+import tomoman_preview_cache as tomoman_preview_cache
 
 def tomoman_clean_stacks(tomolist, p, c, st, write_list=True, root_dir=None, tomolist_name=None, skip_3dmod=False):
     """
@@ -75,9 +77,22 @@ def tomoman_clean_stacks(tomolist, p, c, st, write_list=True, root_dir=None, tom
             tilts = np.sort(tilts)
     
         # Launch tilt-stack in 3dmod if not skipping
+        bin_name = None
         if not skip_3dmod:
-            cmd = f"3dmod -b {c['clean_binning']} {tomolist['stack_dir']}{tomolist['stack_name']}"
-            subprocess.run(cmd, shell=True)
+            if p.get('preview_cache', 0) and c['clean_binning'] in p.get('preview_binnings', []):
+                # Open cached preview, building it if needed
+                previews = tomoman_preview_cache.tomoman_update_previews(f"{tomolist['stack_dir']}{tomolist['stack_name']}", p)
+                cmd = f"3dmod {previews[c['clean_binning']]}"
+                subprocess.run(cmd, shell=True)
+            elif c.get('native_binning', 0) and c['clean_binning'] > 1:
+                # Bin natively, so 3dmod does not read the full-size stack
+                bin_name = f"{tomolist['stack_dir']}{os.path.splitext(tomolist['stack_name'])[0]}_bin{c['clean_binning']}.st"
+                tomoman_bin_stack.tomoman_bin_stack(f"{tomolist['stack_dir']}{tomolist['stack_name']}", bin_name, c['clean_binning'], c.get('binning_method', 'block'))
+                cmd = f"3dmod {bin_name}"
+                subprocess.run(cmd, shell=True)
+            else:
+                cmd = f"3dmod -b {c['clean_binning']} {tomolist['stack_dir']}{tomolist['stack_name']}"
+                subprocess.run(cmd, shell=True)
         else:
             # If skipping 3dmod, print available tilts for reference
             print(f"\nStack {tomo_str} - Available tilts:")
@@ -102,6 +117,10 @@ def tomoman_clean_stacks(tomolist, p, c, st, write_list=True, root_dir=None, tom
                 else:
                     print('Your input is unacceptable!!!')
         
+        # 3dmod detaches from the shell, so the binned stack is only removed once the user is done with it
+        if bin_name is not None:
+            os.remove(bin_name)
+        
         # If there are bad tilts, fix the stack
         if assess_string == 'skip':
             
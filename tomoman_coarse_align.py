@@ -0,0 +1,274 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import sg_mrcread as sg_mrcread
+import tomoman_apply_xf as tomoman_apply_xf
+import tomoman_bin_stack as tomoman_bin_stack
+import tomoman_fft as tomoman_fft
+import tomoman_frequencyarray as tomoman_frequencyarray
+import tomoman_precision as tomoman_precision
+
+# IMOD transform format
+xf_format = '%12.7f%12.7f%12.7f%12.7f%12.3f%12.3f'
+
+
+def tomoman_coarse_align(stack_name, tlt_name, prexf_name, tilt_axis_angle=0.0, binning=4, angle_offset=0.0, trimming=0, taper_fraction=0.1, radial=(0.25, 0.05), sigma1=0.03, prexg_name=None, method='fourier', batch_size=8, n_workers=8):
+    """
+    Coarse align a tilt series by cross-correlating neighbouring tilts, as
+    tiltxcorr does.
+
+    Each tilt is correlated with its neighbour closer to the reference (zero)
+    tilt. The tilt further from zero is stretched perpendicular to the tilt
+    axis by the ratio of the cosines of the two tilt angles. Tilts are
+    Fourier binned, trimmed and tapered in parallel threads, and pairs are
+    correlated with batched FFTs.
+
+    The .prexf file holds one translation per tilt that aligns it to the
+    previous tilt in the file, in unbinned pixels. The optional .prexg file
+    holds the accumulated translations that align every tilt to the
+    reference tilt, as xftoxg -nfit 0 would write.
+
+    Parameters:
+    -----------
+    stack_name : str
+        Path of the tilt stack, sorted by tilt angle
+    tlt_name : str
+        Path of the .tlt or .rawtlt file
+    prexf_name : str
+        Path of the output .prexf file
+    tilt_axis_angle : float
+        Rotation of the tilt axis from the Y axis (degrees, counterclockwise)
+    binning : int
+        Binning factor for the correlations
+    angle_offset : float
+        Offset added to all tilt angles, e.g. the lamella pretilt
+        (AngleOffset of tiltxcorr)
+    trimming : int
+        Border in unbinned pixels excluded from the correlations
+        (BordersInXandY of tiltxcorr)
+    taper_fraction : float
+        Fraction of the trimmed size over which the edges are tapered
+    radial : tuple
+        Cutoff and Gaussian falloff of the low-pass filter in cycles/pixel of
+        the binned stack (FilterRadius2 and FilterSigma2 of tiltxcorr)
+    sigma1 : float
+        Gaussian sigma of the high-pass filter (FilterSigma1 of tiltxcorr)
+    prexg_name : str, optional
+        Path of the output .prexg file
+    method : str
+        Binning method, 'fourier' or 'block'
+    batch_size : int
+        Number of tilt pairs per batched FFT
+    n_workers : int
+        Number of threads
+
+    Returns:
+    --------
+    prexf : ndarray
+        Transforms of shape (n_tilts, 6)
+    """
+    binning = int(binning)
+    stack = sg_mrcread.sg_mrcread(stack_name)[0]
+    n_tilts = stack.shape[2]
+
+    angles = np.loadtxt(tlt_name, ndmin=1) + angle_offset
+    if len(angles) != n_tilts:
+        raise ValueError(f"ACHTUNG!!! {tlt_name} has {len(angles)} tilt angles, but {stack_name} has {n_tilts} tilts!!!")
+
+    # Each tilt is correlated with its neighbour towards the reference tilt
+    ref = int(np.argmin(np.abs(angles)))
+    pairs = [(i, i + 1) for i in range(ref)] + [(i, i - 1) for i in range(ref + 1, n_tilts)]
+
+    print(f"TOMOMAN: Coarse aligning {stack_name}...")
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        binned = list(executor.map(lambda i: tomoman_bin_stack.tomoman_bin_image(stack[:, :, i], binning, method), range(n_tilts)))
+
+        # Correlation area and filters
+        border = int(trimming) // binning
+        shape = tuple(n - 2 * border for n in binned[0].shape)
+        if min(shape) < 2:
+            raise ValueError(f"ACHTUNG!!! Trimming of {trimming} pixels leaves nothing to correlate!!!")
+        window = tomoman_taper_window(shape, taper_fraction)
+        xcorr_filter = tomoman_xcorr_filter(shape, radial, sigma1)
+
+        # Stretch perpendicular to the tilt axis
+        phi = np.deg2rad(tilt_axis_angle)
+        normal = np.array([np.cos(phi), np.sin(phi)])
+
+        def stretch_matrix(i, j):
+            # Maps tilt i onto the foreshortening of tilt j
+            stretch = np.cos(np.deg2rad(angles[j])) / np.cos(np.deg2rad(angles[i]))
+            return np.eye(2) + (stretch - 1) * np.outer(normal, normal)
+
+        def prepare_pair(pair):
+            i, j = pair
+            a = stretch_matrix(i, j)
+            mov = tomoman_apply_xf.tomoman_transform_image(binned[i], np.concatenate([a.ravel(), [0, 0]]))
+            return (tomoman_prepare_image(binned[j], border, window), tomoman_prepare_image(mov, border, window))
+
+        shifts = np.zeros((n_tilts, 2))
+        for start in range(0, len(pairs), int(batch_size)):
+            batch = pairs[start:start + int(batch_size)]
+            refs, movs = zip(*executor.map(prepare_pair, batch))
+            for (i, j), shift in zip(batch, tomoman_batch_xcorr(np.stack(refs), np.stack(movs), xcorr_filter)):
+                # Shifts are measured on the stretched tilt; undo the stretch
+                shifts[i] = np.linalg.inv(stretch_matrix(i, j)) @ shift * binning
+
+    # Transforms relative to the previous tilt in the file
+    prexf = np.zeros((n_tilts, 6))
+    prexf[:, 0] = 1
+    prexf[:, 3] = 1
+    for i in range(1, n_tilts):
+        prexf[i, 4:] = shifts[i] if i > ref else -shifts[i - 1]
+    np.savetxt(prexf_name, prexf, fmt=xf_format)
+
+    if prexg_name is not None:
+        np.savetxt(prexg_name, tomoman_accumulate_xf(prexf, ref), fmt=xf_format)
+
+    return prexf
+
+
+def tomoman_coarse_align_batch(jobs, n_workers=4):
+    """
+    Coarse align several tilt series in parallel processes.
+
+    Parameters:
+    -----------
+    jobs : list of dict
+        Keyword arguments of tomoman_coarse_align, one dict per stack
+    n_workers : int
+        Number of processes
+
+    Returns:
+    --------
+    prexfs : list of ndarray
+        Transforms of each stack
+    """
+    # Workers get the FFT backend and precision explicitly, as they may not be forked
+    settings = (tomoman_fft.fft_settings['backend'], dict(tomoman_precision.precision_settings))
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=init_batch_worker, initargs=(settings,)) as executor:
+        return list(executor.map(coarse_align_job, jobs))
+
+
+def init_batch_worker(settings):
+    """
+    Set up a pool worker; parallelism comes from the processes.
+    """
+    tomoman_fft.tomoman_fft_set_backend(settings[0], workers=1)
+    tomoman_precision.precision_settings.update(settings[1])
+
+
+def coarse_align_job(job):
+    """
+    Run one coarse alignment in a pool worker.
+    """
+    return tomoman_coarse_align(**dict({'n_workers': 1}, **job))
+
+
+def tomoman_accumulate_xf(prexf, ref):
+    """
+    Accumulate translations that align each tilt to the previous one into
+    translations that align each tilt to the reference tilt.
+    """
+    prexg = prexf.copy()
+    prexg[ref, 4:] = 0
+    for i in range(ref + 1, len(prexf)):
+        prexg[i, 4:] = prexg[i - 1, 4:] + prexf[i, 4:]
+    for i in range(ref - 1, -1, -1):
+        prexg[i, 4:] = prexg[i + 1, 4:] - prexf[i + 1, 4:]
+    return prexg
+
+
+def tomoman_prepare_image(image, border, window):
+    """
+    Trim, mean-subtract and taper an image for correlation.
+    """
+    x, y = image.shape
+    image = np.asarray(image[border:x - border, border:y - border], dtype=tomoman_precision.tomoman_real_dtype())
+    return (image - image.mean(dtype=np.float64)) * window
+
+
+def tomoman_taper_window(shape, fraction=0.1):
+    """
+    Separable window that falls off with a cosine over the given fraction of
+    each dimension at the edges.
+    """
+    axes = []
+    for n in shape:
+        w = np.ones(n)
+        n_taper = int(fraction * n)
+        if n_taper > 0:
+            ramp = 0.5 * (1 - np.cos(np.pi * (np.arange(n_taper) + 0.5) / n_taper))
+            w[:n_taper] = ramp
+            w[n - n_taper:] = ramp[::-1]
+        axes.append(w)
+
+    return np.outer(axes[0], axes[1]).astype(tomoman_precision.tomoman_real_dtype())
+
+
+def tomoman_xcorr_filter(shape, radial=(0.25, 0.05), sigma1=0.03):
+    """
+    Band-pass filter for correlations in rfft2 layout: a Gaussian high-pass
+    with sigma1, and a low-pass that falls off with a Gaussian of sigma2
+    beyond radius2 (all in cycles/pixel).
+    """
+    f = tomoman_frequencyarray.tomoman_rfft_frequencyarray(shape, 1.0, dtype=np.float64)
+    radius2, sigma2 = radial
+    weights = np.ones_like(f)
+    if sigma1 > 0:
+        weights *= 1 - np.exp(-np.square(f) / (2 * sigma1 ** 2))
+    if sigma2 > 0:
+        weights *= np.exp(-np.square(np.maximum(f - radius2, 0)) / (2 * sigma2 ** 2))
+
+    return weights.astype(tomoman_precision.tomoman_real_dtype())
+
+
+def tomoman_batch_xcorr(refs, movs, xcorr_filter=None):
+    """
+    Cross-correlate batches of images with one FFT call per batch.
+
+    Parameters:
+    -----------
+    refs, movs : ndarray
+        Reference and moving images (n, x, y)
+    xcorr_filter : ndarray, optional
+        Filter in rfft2 layout (x, y // 2 + 1)
+
+    Returns:
+    --------
+    shifts : ndarray
+        Subpixel shifts (n, 2) such that refs[k](r) = movs[k](r - shift)
+    """
+    shape = refs.shape[-2:]
+    spectra = tomoman_fft.rfft2(np.concatenate([refs, movs]))
+    n = len(refs)
+    cross = spectra[:n] * np.conj(spectra[n:])
+    if xcorr_filter is not None:
+        cross *= xcorr_filter
+
+    return tomoman_find_peaks(tomoman_fft.irfft2(cross, shape))
+
+
+def tomoman_find_peaks(cc):
+    """
+    Locate the maxima of a batch of circular correlation maps (n, x, y) with
+    parabolic subpixel interpolation, as signed shifts (n, 2).
+    """
+    n, x, y = cc.shape
+    peak = np.argmax(cc.reshape(n, -1), axis=1)
+    px, py = np.unravel_index(peak, (x, y))
+    k = np.arange(n)
+
+    # Three-point parabolic fit along each axis, wrapping around the edges
+    center = cc[k, px, py].astype(np.float64)
+    shifts = np.zeros((n, 2))
+    for axis, (p, size) in enumerate([(px, x), (py, y)]):
+        if axis == 0:
+            lo, hi = cc[k, (p - 1) % x, py], cc[k, (p + 1) % x, py]
+        else:
+            lo, hi = cc[k, px, (p - 1) % y], cc[k, px, (p + 1) % y]
+        denom = lo - 2 * center + hi
+        offset = np.where(denom < 0, 0.5 * (lo - hi) / np.where(denom < 0, denom, 1), 0)
+        shift = p + offset
+        shifts[:, axis] = np.where(shift > size / 2, shift - size, shift)
+
+    return shifts
@@ -0,0 +1,122 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import tomoman_frequencyarray as tomoman_frequencyarray
+import tomoman_precision as tomoman_precision
+
+# Cache settings
+cache_settings = {
+    'max_bytes': 2 * 1024**3,   # Upper bound on the memory held by cached filters
+    'max_terms': 8              # Number of critical-exposure terms kept
+}
+
+# Least recently used entries are first
+critical_exposure_cache = OrderedDict()
+filter_cache = OrderedDict()
+cache_lock = threading.Lock()
+cache_bytes = [0]
+
+
+def tomoman_critical_exposure(shape, pixelsize, a, b, c):
+    """
+    Return the critical-exposure term 2 * (a * f^b + c) of the Grant and
+    Grigorieff exposure filter, in the layout of an rfft2 half spectrum.
+
+    The term only depends on image size, pixel size and the critical exposure
+    constants, so it is computed once and cached. The term is computed in
+    double precision and stored in the current precision. The returned array
+    is read-only.
+
+    Parameters:
+    -----------
+    shape : tuple
+        Real-space image size (x, y)
+    pixelsize : float
+        Pixel size in Angstroms
+    a, b, c : float
+        Resolution-dependent critical exposure constants
+
+    Returns:
+    --------
+    crit_exp : ndarray
+        Array of shape (x, y // 2 + 1)
+    """
+    key = (tuple(int(n) for n in shape), float(pixelsize), float(a), float(b), float(c), tomoman_precision.tomoman_real_dtype())
+
+    with cache_lock:
+        if key in critical_exposure_cache:
+            critical_exposure_cache.move_to_end(key)
+            return critical_exposure_cache[key]
+
+    # Initialize frequency array; the zero frequency is offset to avoid a division by zero
+    freq_array = tomoman_frequencyarray.tomoman_rfft_frequencyarray(key[0], key[1], dtype=np.float64)
+    freq_array[0, 0] = 1e-10
+
+    crit_exp = (2 * ((key[2] * (freq_array ** key[3])) + key[4])).astype(key[5])
+    crit_exp.setflags(write=False)
+
+    with cache_lock:
+        critical_exposure_cache[key] = crit_exp
+        while len(critical_exposure_cache) > cache_settings['max_terms']:
+            critical_exposure_cache.popitem(last=False)
+
+    return crit_exp
+
+
+def tomoman_dose_filter(shape, pixelsize, dose, a, b, c):
+    """
+    Return the exposure filter exp(-dose / (2 * (a * f^b + c))) in the layout
+    of an rfft2 half spectrum.
+
+    Filters are kept in a least-recently-used cache bounded by
+    cache_settings['max_bytes'], so stacks sharing image size, pixel size and
+    dose schedule reuse them across tilts and tomograms. The returned array is
+    read-only.
+
+    Parameters:
+    -----------
+    shape : tuple
+        Real-space image size (x, y)
+    pixelsize : float
+        Pixel size in Angstroms
+    dose : float
+        Accumulated dose in e/A^2
+    a, b, c : float
+        Resolution-dependent critical exposure constants
+
+    Returns:
+    --------
+    dose_filter : ndarray
+        Array of shape (x, y // 2 + 1)
+    """
+    key = (tuple(int(n) for n in shape), float(pixelsize), float(a), float(b), float(c), tomoman_precision.tomoman_real_dtype(), float(dose))
+
+    with cache_lock:
+        if key in filter_cache:
+            filter_cache.move_to_end(key)
+            return filter_cache[key]
+
+    crit_exp = tomoman_critical_exposure(shape, pixelsize, a, b, c)
+    dose_filter = np.exp(-key[6] / crit_exp)
+    dose_filter.setflags(write=False)
+
+    with cache_lock:
+        if key not in filter_cache:
+            filter_cache[key] = dose_filter
+            cache_bytes[0] += dose_filter.nbytes
+
+        # Evict least recently used filters, always keeping the newest one
+        while cache_bytes[0] > cache_settings['max_bytes'] and len(filter_cache) > 1:
+            cache_bytes[0] -= filter_cache.popitem(last=False)[1].nbytes
+
+    return dose_filter
+
+
+def tomoman_clear_dose_filter_cache():
+    """
+    Empty the dose-filter caches.
+    """
+    with cache_lock:
+        critical_exposure_cache.clear()
+        filter_cache.clear()
+        cache_bytes[0] = 0
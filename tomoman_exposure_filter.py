@@ -1,13 +1,16 @@
 import os
+import contextlib
 import numpy as np
 from scipy.io import savemat
-import mrcfile
 import tomoman_function_dose_filter_stack as tomoman_function_dose_filter_stack
 import tomoman_function_dose_filter_frame_stack as tomoman_function_dose_filter_frame_stack
 import tomoman_resize_stack as tomoman_resize_stack
 import tom_mirror as tom_mirror
-import sg_read_mrc_header as sg_read_mrc_header
+import sg_mrcread as sg_mrcread
 import sg_generate_mrc_header as sg_generate_mrc_header
+import sg_append_mrc_label_enhanced as sg_append_mrc_label_enhanced
+import sg_mrc_stream_writer as sg_mrc_stream_writer
+import tomoman_prefetch as tomoman_prefetch
 
 def tomoman_exposure_filter(tomolist, p, st, df, write_list):
     """
@@ -88,111 +91,142 @@ def tomoman_exposure_filter(tomolist, p, st, df, write_list):
         st_name, st_ext = os.path.splitext(tomolist['stack_name'])
         newstack_name = f"{st_name}{df['dfilt_append']}{st_ext}"
         
-        # Apply exposure filters
-        if not df['filter_frames']:  # Case 0: Apply filter to stack
-            print("TOMOMAN: Exposure filtering image stack...")
-            
-            # Read stack
-            print(f"TOMOMAN: Reading stack {tomolist['stack_name']}...")
-            stack_path = os.path.join(tomolist['stack_dir'], tomolist['stack_name'])
-            with mrcfile.open(stack_path) as mrc:
-                stack = mrc.data
-                header = mrc.header
-            
-            # Exposure filter
-            df_stack = tomoman_function_dose_filter_stack.tomoman_function_dose_filter_stack(stack, tomolist['pixelsize'], dose_array[:, 1], a, b, c)
-            
-            # Header label
-            dose_str = f"{tomolist['dose'][0]/tomolist['cumulative_exposure_time'][0]:.4f}"
+        # Header label
+        dose_str = f"{tomolist['dose'][0]/tomolist['cumulative_exposure_time'][0]:.4f}"
+        if not df['filter_frames']:
             label = f"TOMOMAN: Exposure filtered on images with {dose_str} e/(A^2)/s"
+        else:
+            label = f"TOMOMAN: Exposure filtered on frames with {dose_str} e/(A^2)/s"
+        header = sg_generate_mrc_header.sg_generate_mrc_header()
+        header = sg_append_mrc_label_enhanced.sg_append_mrc_label(header, label)
+        
+        # Filtered tilts are streamed to the output stack
+        print(f"TOMOMAN: Saving dose filtered stack {newstack_name}!!!")
+        output_path = os.path.join(tomolist['stack_dir'], newstack_name)
+        
+        # Binned dose-filtered stacks, Fourier cropped from the filtered spectra
+        binnings = [int(f) for f in df.get('binnings', [])]
+        if binnings and df['filter_frames']:
+            print("ACHTUNG!!! Binned dose-filtered stacks are only generated when filtering images... Skipping binned stacks!!!")
+            binnings = []
+        binned_names = {f: f"{st_name}{df['dfilt_append']}_bin{f}{st_ext}" for f in binnings}
+        
+        # Writers are closed when the block exits, also when filtering fails
+        with contextlib.ExitStack() as outputs:
+            writer = outputs.enter_context(sg_mrc_stream_writer.sg_mrc_stream_writer(output_path, header, mode=df.get('output_mode', 2), pixelsize=tomolist['pixelsize']))
+            binned_writers = [outputs.enter_context(sg_mrc_stream_writer.sg_mrc_stream_writer(os.path.join(tomolist['stack_dir'], binned_names[f]), header, mode=df.get('output_mode', 2), pixelsize=tomolist['pixelsize'] * f)) for f in binnings]
             
-            # Update tomolist
-            tomolist['dose_filter_algorithm'] = 'TOMOMAN-images'
-            
-        else:  # Case 1: Exposure filtering frame stacks
-            print("TOMOMAN: Exposure filtering frame stacks...")
-            
-            # Initialize stack
-            df_stack = np.zeros((tomolist['image_size'][0], tomolist['image_size'][1], n_tilts))
-            
-            # Loop through frame stacks
-            for j in range(n_tilts):
-                # Generate stack order
-                sorted_idx = np.argsort(tomolist['collected_tilts'])
-                frame_idx = np.where(sorted_idx == tilt_idx[j])[0][0] + 1  # +1 to match MATLAB 1-based indexing
+            # Apply exposure filters
+            if not df['filter_frames']:  # Case 0: Apply filter to stack
+                print("TOMOMAN: Exposure filtering image stack...")
                 
-                # Frame stack name
-                tomo_str = f"{tomolist['tomo_num']:0{p['digits']}d}"
-                frame_name = f"{tomo_str}_{frame_idx}_Stk.mrc"
+                # Memory-map stack; unless filtering in parallel, tilts are read, filtered and written one at a time
+                print(f"TOMOMAN: Reading stack {tomolist['stack_name']}...")
+                stack_path = os.path.join(tomolist['stack_dir'], tomolist['stack_name'])
+                stack, _ = sg_mrcread.sg_mrcread(stack_path)
+                if stack.shape[2] != n_tilts:
+                    raise ValueError("ACHTUNG!!! Stack size and dose-list do not match!!!")
                 
-                # Final dose
-                final_dose = dose_array[j, 1]
+                def write_tilt(images):
+                    writer.append(images[0])
+                    for binned_writer, binned_img in zip(binned_writers, images[1]):
+                        binned_writer.append(binned_img)
                 
-                # Initial dose
-                if tilt_idx[j] == 0:  # First tilt
-                    init_dose = df['preexposure']
+                if df.get('n_workers', 1) > 1:
+                    # Filter tilts in parallel processes through shared memory
+                    df_stack = tomoman_function_dose_filter_stack.tomoman_function_dose_filter_stack(stack.transpose(2, 0, 1), tomolist['pixelsize'], dose_array[:, 1], a, b, c, n_workers=df['n_workers'], binnings=binnings)
+                    binned_stacks = {}
+                    if binnings:
+                        df_stack, binned_stacks = df_stack
+                    for j in range(n_tilts):
+                        write_tilt((df_stack[j], [binned_stacks[f][j] for f in binnings]))
+                    del df_stack, binned_stacks
                 else:
-                    init_dose = tomolist['dose'][tilt_idx[j]-1] + df['preexposure']
+                    def read_tilt(j):
+                        return np.array(stack[:, :, j])
+                    
+                    # Exposure filter; the next tilt is read and the previous tilt written in the background
+                    with tomoman_prefetch.tomoman_write_behind(write_tilt) as sink:
+                        for j, img in enumerate(tomoman_prefetch.tomoman_prefetch(read_tilt, range(n_tilts))):
+                            sink.put(tomoman_function_dose_filter_stack.tomoman_dose_filter_image(img, tomolist['pixelsize'], dose_array[j, 1], a, b, c, binnings))
+                            print(f"TOMOMAN: Image {j+1} of {n_tilts} filtered...")
+                del stack
                 
-                # Calculate dose per frame
-                if len(tomolist['n_frames']) == 1:
-                    dpf = (final_dose - init_dose) / tomolist['n_frames']
-                else:
-                    dpf = (final_dose - init_dose) / tomolist['n_frames'][j]
+                # Update tomolist
+                tomolist['dose_filter_algorithm'] = 'TOMOMAN-images'
                 
-                # Read frame stack
-                print(f"TOMOMAN: Reading stack {frame_name}...")
-                try:
-                    frame_path = os.path.join(tomolist['stack_dir'], "MotionCor2", frame_name)
-                    with mrcfile.open(frame_path) as mrc:
-                        frame_stack = mrc.data
-                except Exception as e:
-                    raise Exception(f"ACHTUNG!!! Frame stack {frame_path} not found!!! Did you remember to generate aligned frame stacks with MotionCor2??? Error: {str(e)}")
+            else:  # Case 1: Exposure filtering frame stacks
+                print("TOMOMAN: Exposure filtering frame stacks...")
                 
-                # Filter stack
-                filt_img = tomoman_function_dose_filter_frame_stack.tomoman_function_dose_filter_frame_stack(frame_stack, tomolist['pixelsize'], init_dose, dpf, a, b, c)
-                filt_img = tomoman_resize_stack.tomoman_resize_stack(filt_img, tomolist['image_size'][0], tomolist['image_size'][1], True)
+                # Frame stack names
+                tomo_str = f"{tomolist['tomo_num']:0{p['digits']}d}"
+                sorted_idx = np.argsort(tomolist['collected_tilts'])
+                frame_paths = []
+                for j in range(n_tilts):
+                    # Generate stack order
+                    frame_idx = np.where(sorted_idx == tilt_idx[j])[0][0] + 1  # +1 to match MATLAB 1-based indexing
+                    frame_paths.append(os.path.join(tomolist['stack_dir'], "MotionCor2", f"{tomo_str}_{frame_idx}_Stk.mrc"))
                 
-                if tomolist['mirror_stack'] != 'none':
-                    filt_img = tom_mirror.tom_mirror(filt_img, tomolist['mirror_stack'])
+                # Loop through frame stacks; frame stacks are memory-mapped and the previous image is written in the background
+                with tomoman_prefetch.tomoman_write_behind(writer.append) as sink:
+                    for j in range(n_tilts):
+                        frame_stack = read_frame_stack(frame_paths[j])
+                        
+                        # Final dose
+                        final_dose = dose_array[j, 1]
+                        
+                        # Initial dose
+                        if tilt_idx[j] == 0:  # First tilt
+                            init_dose = df['preexposure']
+                        else:
+                            init_dose = tomolist['dose'][tilt_idx[j]-1] + df['preexposure']
+                        
+                        # Calculate dose per frame
+                        if len(tomolist['n_frames']) == 1:
+                            dpf = (final_dose - init_dose) / tomolist['n_frames'][0]
+                        else:
+                            dpf = (final_dose - init_dose) / tomolist['n_frames'][j]
+                        
+                        # Filter stack
+                        filt_img = tomoman_function_dose_filter_frame_stack.tomoman_function_dose_filter_frame_stack(frame_stack, tomolist['pixelsize'], init_dose, dpf, a, b, c)
+                        del frame_stack
+                        filt_img = tomoman_resize_stack.tomoman_resize_stack(filt_img[:, :, np.newaxis], tomolist['image_size'][0], tomolist['image_size'][1], True)
+                        
+                        if tomolist['mirror_stack'] in ['x', 'y']:
+                            filt_img = tom_mirror.tom_mirror(filt_img, tomolist['mirror_stack'])
+                        
+                        sink.put(filt_img)
                 
-                df_stack[:, :, j] = filt_img
-            
-            # Grab header from stack
-            try:
-                header = sg_read_mrc_header(os.path.join(tomolist['stack_dir'], tomolist['stack_name']))
-            except:
-                header = sg_generate_mrc_header.sg_generate_mrc_header()
-            
-            # Header label
-            dose_str = f"{tomolist['dose'][0]/tomolist['cumulative_exposure_time'][0]:.4f}"
-            label = f"TOMOMAN: Exposure filtered on frames with {dose_str} e/(A^2)/s"
-            
-            # Update tomolist
-            tomolist['dose_filter_algorithm'] = 'TOMOMAN-frames'
-        
-        # Write stack with header
-        print(f"TOMOMAN: Saving dose filtered stack {newstack_name}!!!")
-        output_path = os.path.join(tomolist['stack_dir'], newstack_name)
-        with mrcfile.new(output_path, overwrite=True) as mrc:
-            mrc.set_data(df_stack.astype(np.float32))
-            # Copy header values and set pixel size
-            # Note: mrcfile handles headers differently than MATLAB
-            mrc.voxel_size = (tomolist['pixelsize'], tomolist['pixelsize'], tomolist['pixelsize'])
-            # Add label
-            mrc.header.label[0] = label.encode()
+                # Update tomolist
+                tomolist['dose_filter_algorithm'] = 'TOMOMAN-frames'
         
         # Update tomolist
         tomolist['dose_filtered'] = True
         tomolist['dose_filtered_stack_name'] = newstack_name
+        tomolist['dose_filtered_binned_stack_names'] = binned_names
         
-        # Write rawtilt file
+        # Write rawtilt files
         rawtilt_path = os.path.join(tomolist['stack_dir'], f"{st_name}{df['dfilt_append']}.rawtlt")
         np.savetxt(rawtilt_path, tomolist['rawtlt'], fmt='%.6f')
+        for f in binnings:
+            np.savetxt(os.path.join(tomolist['stack_dir'], f"{st_name}{df['dfilt_append']}_bin{f}.rawtlt"), tomolist['rawtlt'], fmt='%.6f')
         
         # Save tomolist
         if write_list:
             tomolist_path = os.path.join(p['root_dir'], p['tomolist_name'])
             savemat(tomolist_path, {'tomolist': tomolist})
 
-    return tomolist
\ No newline at end of file
+    return tomolist
+
+
+def read_frame_stack(frame_path):
+    """
+    Memory-map an aligned frame stack, ordered (x, y, frame).
+    """
+    print(f"TOMOMAN: Reading stack {os.path.basename(frame_path)}...")
+    try:
+        frame_stack, _ = sg_mrcread.sg_mrcread(frame_path)
+    except Exception as e:
+        raise Exception(f"ACHTUNG!!! Frame stack {frame_path} not found!!! Did you remember to generate aligned frame stacks with MotionCor2??? Error: {str(e)}")
+    
+    return frame_stack
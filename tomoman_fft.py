@@ -0,0 +1,195 @@
+import os
+import threading
+import numpy as np
+
+# Optional backends
+try:
+    import scipy.fft as scipy_fft
+except ImportError:
+    scipy_fft = None
+
+try:
+    import pyfftw as pyfftw
+    import pyfftw.builders as pyfftw_builders
+except ImportError:
+    pyfftw = None
+
+# Backend settings shared by all Fourier code paths
+fft_settings = {
+    'backend': 'scipy' if scipy_fft is not None else 'numpy',
+    'workers': os.cpu_count() or 1,
+    'planner_effort': 'FFTW_MEASURE'
+}
+
+# pyFFTW plans are not thread safe, so each thread keeps its own plan cache
+plan_cache = threading.local()
+
+
+def tomoman_fft_set_backend(backend=None, workers=None, planner_effort=None):
+    """
+    Select the FFT backend and number of threads used by tomoman_fft.
+
+    Parameters:
+    -----------
+    backend : str, optional
+        'scipy' (default), 'pyfftw' or 'numpy'. Falls back to 'scipy' or
+        'numpy' if the requested package is not installed.
+    workers : int, optional
+        Number of threads per transform (default: all cores). Ignored by numpy.
+    planner_effort : str, optional
+        pyFFTW planner effort (default: 'FFTW_MEASURE')
+    """
+    if backend is not None:
+        if backend not in ['scipy', 'pyfftw', 'numpy']:
+            raise ValueError(f"ACHTUNG!!! Invalid FFT backend: {backend}!!! Options are 'scipy', 'pyfftw' and 'numpy'!!!")
+        if backend == 'pyfftw' and pyfftw is None:
+            print("ACHTUNG!!! pyFFTW not found!!! Falling back to scipy.fft...")
+            backend = 'scipy'
+        if backend == 'scipy' and scipy_fft is None:
+            print("ACHTUNG!!! scipy.fft not found!!! Falling back to numpy.fft...")
+            backend = 'numpy'
+        fft_settings['backend'] = backend
+
+    if workers is not None:
+        fft_settings['workers'] = max(int(workers), 1)
+
+    if planner_effort is not None:
+        fft_settings['planner_effort'] = planner_effort
+
+    # Plans depend on the settings
+    plan_cache.__dict__.clear()
+
+
+def rfft2(image):
+    """
+    Real-to-complex 2D FFT over the last two axes.
+
+    Parameters:
+    -----------
+    image : ndarray
+        Real image or stack of images (..., x, y)
+
+    Returns:
+    --------
+    ndarray
+        Half spectrum of shape (..., x, y // 2 + 1)
+    """
+    return transform('rfft2', image)
+
+
+def irfft2(spectrum, shape):
+    """
+    Complex-to-real inverse 2D FFT over the last two axes.
+
+    Parameters:
+    -----------
+    spectrum : ndarray
+        Half spectrum (..., x, y // 2 + 1)
+    shape : tuple
+        Real-space size (x, y) of the output
+
+    Returns:
+    --------
+    ndarray
+        Real image or stack of images (..., x, y)
+    """
+    return transform('irfft2', spectrum, tuple(shape))
+
+
+def fft2(image):
+    """
+    Complex 2D FFT over the last two axes.
+    """
+    return transform('fft2', image)
+
+
+def ifft2(spectrum):
+    """
+    Complex inverse 2D FFT over the last two axes.
+    """
+    return transform('ifft2', spectrum)
+
+
+def transform(kind, data, shape=None):
+    """
+    Dispatch a 2D transform to the selected backend.
+    """
+    backend = fft_settings['backend']
+    workers = fft_settings['workers']
+
+    if backend == 'pyfftw':
+        return pyfftw_transform(kind, data, shape, workers)
+
+    if backend == 'scipy':
+        fn = getattr(scipy_fft, kind)
+        if shape is not None:
+            return fn(data, s=shape, workers=workers)
+        return fn(data, workers=workers)
+
+    fn = getattr(np.fft, kind)
+    if shape is not None:
+        return fn(data, s=shape)
+    return fn(data)
+
+
+def pyfftw_transform(kind, data, shape, workers):
+    """
+    Run a transform with a cached pyFFTW plan.
+    """
+    data = np.asarray(data)
+    key = (kind, data.shape, data.dtype.str, shape, workers)
+
+    plans = plan_cache.__dict__
+    plan = plans.get(key)
+    if plan is None:
+        builder = getattr(pyfftw_builders, kind)
+        template = pyfftw.empty_aligned(data.shape, dtype=data.dtype)
+        kwargs = {'threads': workers, 'planner_effort': fft_settings['planner_effort']}
+        if shape is not None:
+            kwargs['s'] = shape
+        plan = builder(template, **kwargs)
+        plans[key] = plan
+
+    # The plan reuses its output array, so return a copy
+    return plan(data).copy()
+
+
+def crop_rfft2(spectrum, shape, new_shape):
+    """
+    Fourier crop an rfft2 half spectrum to a smaller real-space size.
+
+    Transforming the cropped spectrum with irfft2(cropped, new_shape) gives an
+    antialiased, binned image. The spectrum is scaled so that the binned image
+    keeps the mean intensity of the original.
+
+    Parameters:
+    -----------
+    spectrum : ndarray
+        Half spectrum (..., x, y // 2 + 1)
+    shape : tuple
+        Real-space size (x, y) of the spectrum
+    new_shape : tuple
+        Real-space size (new_x, new_y) of the cropped spectrum
+
+    Returns:
+    --------
+    ndarray
+        Half spectrum (..., new_x, new_y // 2 + 1)
+    """
+    x, y = shape
+    new_x, new_y = new_shape
+    if new_x > x or new_y > y:
+        raise ValueError(f"ACHTUNG!!! Cannot Fourier crop size {tuple(shape)} to larger size {tuple(new_shape)}!!!")
+
+    # Non-negative and negative frequencies along the first axis
+    n_pos = (new_x + 1) // 2
+    n_neg = new_x // 2
+    cropped = np.empty(spectrum.shape[:-2] + (new_x, new_y // 2 + 1), dtype=spectrum.dtype)
+    cropped[..., :n_pos, :] = spectrum[..., :n_pos, :new_y // 2 + 1]
+    if n_neg > 0:
+        cropped[..., n_pos:, :] = spectrum[..., x - n_neg:, :new_y // 2 + 1]
+
+    # Preserve the mean
+    cropped *= (new_x * new_y) / (x * y)
+
+    return cropped
@@ -1,6 +1,7 @@
 import numpy as np
+import tomoman_precision as tomoman_precision
 
-def tomoman_frequencyarray(image, pixelsize):
+def tomoman_frequencyarray(image, pixelsize, dtype=None):
     """
     Generate an array with Fourier space frequencies from a volume and pixelsize.
     
@@ -10,6 +11,8 @@ def tomoman_frequencyarray(image, pixelsize):
         Input image/volume
     pixelsize : float
         Pixel size in Angstroms
+    dtype : numpy dtype, optional
+        Output dtype (default: tomoman_precision setting)
         
     Returns:
     --------
@@ -55,4 +58,41 @@ def tomoman_frequencyarray(image, pixelsize):
         # Calculate frequency array
         f_array = np.sqrt(rx**2 + ry**2 + rz**2)
     
-    return f_array
\ No newline at end of file
+    if dtype is None:
+        dtype = tomoman_precision.tomoman_real_dtype()
+    
+    return f_array.astype(dtype, copy=False)
+
+def tomoman_rfft_frequencyarray(shape, pixelsize, dtype=None):
+    """
+    Generate a 2D array of Fourier space frequencies in the layout of an rfft2
+    half spectrum, i.e. unshifted, with only the non-negative frequencies along
+    the last axis.
+
+    Parameters:
+    -----------
+    shape : tuple
+        Real-space image size (x, y)
+    pixelsize : float
+        Pixel size in Angstroms
+    dtype : numpy dtype, optional
+        Output dtype (default: tomoman_precision setting)
+
+    Returns:
+    --------
+    f_array : ndarray
+        Array of shape (x, y // 2 + 1) with Fourier space frequencies
+    """
+    dimx, dimy = shape
+
+    # Projected reciprocal distances
+    rx = np.fft.fftfreq(dimx, d=pixelsize)
+    ry = np.fft.rfftfreq(dimy, d=pixelsize)
+
+    # Calculate frequency array
+    f_array = np.sqrt(rx[:, np.newaxis]**2 + ry[np.newaxis, :]**2)
+
+    if dtype is None:
+        dtype = tomoman_precision.tomoman_real_dtype()
+
+    return f_array.astype(dtype, copy=False)
@@ -1,6 +1,8 @@
 import numpy as np
-from numpy.fft import fft2, ifft2, ifftshift
-import tomoman_frequencyarray as tomoman_frequencyarray
+import tomoman_dose_filter_cache as tomoman_dose_filter_cache
+import tomoman_fft as tomoman_fft
+import tomoman_prefetch as tomoman_prefetch
+import tomoman_precision as tomoman_precision
 def tomoman_function_dose_filter_frame_stack(input_stack, pixelsize, initial_dose, dose_per_frame, a=None, b=None, c=None):
     """
     Exposure filter a frame stack using a modified version of the Grant and Grigorieff approach.
@@ -13,7 +15,7 @@ def tomoman_function_dose_filter_frame_stack(input_stack, pixelsize, initial_dos
     Parameters:
     -----------
     input_stack : ndarray
-        Input image stack (3D array)
+        Input frame stack (x, y, n_frames); may be memory-mapped
     pixelsize : float
         Pixel size in Angstroms
     initial_dose : float
@@ -42,35 +44,37 @@ def tomoman_function_dose_filter_frame_stack(input_stack, pixelsize, initial_dos
     # Get stack dimensions
     x, y, z = input_stack.shape
     
-    # Initialize filter stack
-    filter_stack = np.zeros((x, y, z))
+    # Running sums of filtered FFTs and squared filters
+    fft_sum = np.zeros((x, y // 2 + 1), dtype=tomoman_precision.tomoman_complex_dtype())
+    filter_sq_sum = np.zeros((x, y // 2 + 1), dtype=tomoman_precision.tomoman_real_dtype())
     
-    # Filtered image
-    fft_sum = np.zeros((x, y), dtype=complex)
-    
-    # Initialize frequency array
-    freq_array = tomoman_frequencyarray.tomoman_frequencyarray(input_stack[:, :, 0], pixelsize)
+    # Frames are read one at a time, so the input can be memory-mapped
+    def read_frame(i):
+        return np.array(input_stack[:, :, i], dtype=tomoman_precision.tomoman_real_dtype())
     
-    # Generate and apply filter for each frame
-    for i in range(z):
+    # Generate and apply filter for each frame; the next frame is read in the background
+    for i, frame in enumerate(tomoman_prefetch.tomoman_prefetch(read_frame, range(z))):
         # Calculate FFT
-        fft_img = fft2(input_stack[:, :, i].astype(float))
+        fft_img = tomoman_fft.rfft2(frame)
         
         # Calculate dose
         dose = initial_dose + (dose_per_frame * (i + 1))
         
-        # Calculate filter
-        filter_stack[:, :, i] = ifftshift(np.exp(-dose / (2 * ((a * (freq_array ** b)) + c))))
+        # Get filter
+        filter_values = tomoman_dose_filter_cache.tomoman_dose_filter((x, y), pixelsize, dose, a, b, c)
+        if i == 0:
+            first_filter = filter_values
         
-        # Calculate new image
-        fft_sum = fft_sum + (fft_img * filter_stack[:, :, i])
+        # Accumulate filtered image and squared filters
+        fft_sum += fft_img * filter_values
+        filter_sq_sum += filter_values**2
         
         print(f"TOMOMAN: Frame {i+1} of {z} filtered...")
     
     # Reweighting filter
-    reweight_filter = filter_stack[:, :, 0] / np.sqrt(np.sum(filter_stack**2, axis=2) / z)
+    reweight_filter = first_filter / np.sqrt(filter_sq_sum / z)
     
     # Filtered image
-    filt_img = np.real(ifft2(fft_sum * reweight_filter))
+    filt_img = tomoman_fft.irfft2(fft_sum * reweight_filter, (x, y))
     
-    return filt_img
\ No newline at end of file
+    return filt_img
@@ -1,8 +1,11 @@
 import numpy as np
-from numpy.fft import fft2, ifft2, ifftshift
-import tomoman_frequencyarray as tomoman_frequencyarray
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+import tomoman_dose_filter_cache as tomoman_dose_filter_cache
+import tomoman_fft as tomoman_fft
+import tomoman_precision as tomoman_precision
 
-def tomoman_function_dose_filter_stack(input_stack, pixelsize, dose_list, a=None, b=None, c=None):
+def tomoman_function_dose_filter_stack(input_stack, pixelsize, dose_list, a=None, b=None, c=None, n_workers=1, binnings=None):
     """
     Exposure filter a tilt-stack using a modified version of the Grant and Grigorieff approach.
     
@@ -23,11 +26,19 @@ def tomoman_function_dose_filter_stack(input_stack, pixelsize, dose_list, a=None
         Resolution-dependent critical exposure constant
     c : float, optional
         Resolution-dependent critical exposure constant
+    n_workers : int, optional
+        Number of processes. With more than one, input and output are placed
+        in shared memory and disjoint tilt ranges are filtered in parallel.
+    binnings : list of int, optional
+        Binning factors (e.g. [2, 4, 8]) of additional binned stacks, Fourier
+        cropped from the spectrum of each filtered tilt
         
     Returns:
     --------
     output_stack : ndarray
         Dose-filtered image stack
+    binned_stacks : dict, optional
+        Only if binnings are given: dose-filtered stacks keyed by binning factor
     """
     # Check parameters and set defaults if needed
     if a is None or b is None or c is None:
@@ -50,30 +61,165 @@ def tomoman_function_dose_filter_stack(input_stack, pixelsize, dose_list, a=None
     if len(dose_list) != z:
         raise ValueError("ACHTUNG!!! Stack size and dose-list do not match!!!")
     
-    # Initialize new stack
-    output_stack = np.zeros((z, x, y), dtype=input_stack.dtype)
-    
-    # Initialize frequency array 
-    freq_array = tomoman_frequencyarray.tomoman_frequencyarray(input_stack[0], pixelsize)
-    epsilon = 1e-10 
-    safe_freq_array = np.where(freq_array == 0, epsilon, freq_array)
     b = float(b)
     print(f"b type: {type(b)}, value: {b}")
-    # Generate and apply filter for each tilt
-    for i in range(z):
-        # Calculate FFT 
-        fft_img = fft2(input_stack[i].astype(float))
-        
-        # Calculate filter
-        filter_values = ifftshift(np.exp((-dose_list[i]) / (2 * ((a * (safe_freq_array ** b)) + c))))
-        
-        # Calculate new image
-        output_stack[i] = np.real(ifft2(fft_img * filter_values))
+    binnings = [] if binnings is None else [int(f) for f in binnings]
+    if n_workers > 1 and z > 1:
+        # Filter tilts in parallel processes
+        stacks = dose_filter_stack_shared(input_stack, pixelsize, dose_list, a, b, c, min(n_workers, z), binnings)
+    else:
+        # Initialize new stacks
+        stacks = [np.zeros(shape, dtype=input_stack.dtype) for shape in output_shapes(input_stack.shape, binnings)]
         
-        print(f"TOMOMAN: Image {i+1} of {z} filtered...")
+        # Generate and apply filter for each tilt
+        for i in range(z):
+            # Calculate new images
+            filt_img, binned_imgs = tomoman_dose_filter_image(input_stack[i], pixelsize, dose_list[i], a, b, c, binnings)
+            for stack, img in zip(stacks, [filt_img] + binned_imgs):
+                stack[i] = img
+            
+            print(f"TOMOMAN: Image {i+1} of {z} filtered...")
     
     # If input was 2D, return 2D output 
     if z == 1:
-        output_stack = output_stack[0]
-        
-    return output_stack
\ No newline at end of file
+        stacks = [stack[0] for stack in stacks]
+    
+    if len(binnings) == 0:
+        return stacks[0]
+    
+    return stacks[0], dict(zip(binnings, stacks[1:]))
+
+
+def output_shapes(shape, binnings):
+    """
+    Return the (z, x, y) shapes of the full-size stack and the binned stacks.
+    """
+    z, x, y = shape
+    return [(z, x, y)] + [(z, x // f, y // f) for f in binnings]
+
+
+def tomoman_dose_filter_image(image, pixelsize, dose, a, b, c, binnings=None):
+    """
+    Exposure filter a single image, e.g. one tilt streamed from a stack on disk.
+
+    Parameters:
+    -----------
+    image : ndarray
+        Input image (2D array)
+    pixelsize : float
+        Pixel size in Angstroms
+    dose : float
+        Dose of the image in e/A^2
+    a, b, c : float
+        Resolution-dependent critical exposure constants
+    binnings : list of int, optional
+        Binning factors of additional images, Fourier cropped from the
+        filtered spectrum so that no further FFTs are needed
+
+    Returns:
+    --------
+    filt_img : ndarray
+        Dose-filtered image
+    binned_imgs : list of ndarray, optional
+        Only if binnings are given: dose-filtered binned images, in the order
+        of binnings
+    """
+    # Calculate FFT
+    fft_img = tomoman_fft.rfft2(image.astype(tomoman_precision.tomoman_real_dtype()))
+
+    # Get filter
+    filter_values = tomoman_dose_filter_cache.tomoman_dose_filter(image.shape, pixelsize, dose, a, b, c)
+
+    # Calculate new image
+    fft_img *= filter_values
+    filt_img = tomoman_fft.irfft2(fft_img, image.shape)
+
+    if binnings is None:
+        return filt_img
+
+    # Binned images from the same spectrum
+    binned_imgs = []
+    for f in binnings:
+        new_shape = (image.shape[0] // int(f), image.shape[1] // int(f))
+        binned_imgs.append(tomoman_fft.irfft2(tomoman_fft.crop_rfft2(fft_img, image.shape, new_shape), new_shape))
+
+    return filt_img, binned_imgs
+
+
+def dose_filter_stack_shared(input_stack, pixelsize, dose_list, a, b, c, n_workers, binnings):
+    """
+    Dose filter a (z, x, y) stack with a process pool. The input is copied once
+    into a shared memory block and each process writes its tilt range directly
+    into shared output blocks, so no image data is pickled. Each tilt is
+    filtered independently, so the output does not depend on n_workers.
+    """
+    z = input_stack.shape[0]
+    dtype = input_stack.dtype
+    shapes = [input_stack.shape] + output_shapes(input_stack.shape, binnings)
+    blocks = []
+    try:
+        # Input block followed by one output block per stack
+        for shape in shapes:
+            blocks.append(shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1)))
+        shared_in = np.ndarray(input_stack.shape, dtype=dtype, buffer=blocks[0].buf)
+        shared_in[:] = input_stack
+        del shared_in
+
+        # Contiguous tilt ranges, one per process
+        bounds = np.linspace(0, z, n_workers + 1).astype(int)
+        tasks = [(bounds[i], bounds[i + 1]) for i in range(n_workers) if bounds[i] < bounds[i + 1]]
+
+        # Workers get the FFT backend and precision explicitly, as they may not be forked
+        settings = (tomoman_fft.fft_settings['backend'], dict(tomoman_precision.precision_settings))
+        initargs = ([block.name for block in blocks], shapes, dtype.str, pixelsize, np.asarray(dose_list, dtype=float), a, b, c, binnings, settings)
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=init_shared_worker, initargs=initargs) as executor:
+            # list() re-raises any worker errors
+            list(executor.map(filter_tilt_range, tasks))
+
+        # Release input before copying out the results
+        blocks[0].close()
+        blocks[0].unlink()
+        blocks[0] = None
+
+        stacks = [np.array(np.ndarray(shape, dtype=dtype, buffer=block.buf)) for shape, block in zip(shapes[1:], blocks[1:])]
+    finally:
+        for block in blocks:
+            if block is not None:
+                block.close()
+                block.unlink()
+
+    return stacks
+
+
+# Per-process state of pool workers
+shared_worker = {}
+
+
+def init_shared_worker(names, shapes, dtype, pixelsize, dose_list, a, b, c, binnings, settings):
+    """
+    Attach a pool worker to the shared input and output stacks.
+    """
+    # Parallelism comes from the processes
+    tomoman_fft.tomoman_fft_set_backend(settings[0], workers=1)
+    tomoman_precision.precision_settings.update(settings[1])
+
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    shared_worker.update({
+        'shm': blocks,
+        'input': np.ndarray(shapes[0], dtype=dtype, buffer=blocks[0].buf),
+        'outputs': [np.ndarray(shape, dtype=dtype, buffer=block.buf) for shape, block in zip(shapes[1:], blocks[1:])],
+        'args': (pixelsize, dose_list, a, b, c, binnings)
+    })
+
+
+def filter_tilt_range(bounds):
+    """
+    Filter tilts [start, stop) of the shared stack.
+    """
+    pixelsize, dose_list, a, b, c, binnings = shared_worker['args']
+    z = shared_worker['input'].shape[0]
+    for i in range(bounds[0], bounds[1]):
+        filt_img, binned_imgs = tomoman_dose_filter_image(shared_worker['input'][i], pixelsize, dose_list[i], a, b, c, binnings)
+        for output, img in zip(shared_worker['outputs'], [filt_img] + binned_imgs):
+            output[i] = img
+        print(f"TOMOMAN: Image {i+1} of {z} filtered...")
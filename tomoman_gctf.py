@@ -1,12 +1,12 @@
 import os
-import numpy as np
 import math
 import subprocess
 import shutil
 import tomoman_gctf_star_to_ctfphaseflip as tomoman_gctf_star_to_ctfphaseflip
 import tomoman_mrc_split as tomoman_mrc_split
-import sg_mrcread as sg_mrcread
+import sg_mrcread_many as sg_mrcread_many
 import sg_mrcwrite as sg_mrcwrite
+import tomoman_precision as tomoman_precision
 import tomoman_gctf_parser as tomoman_gctf_parser
 def tomoman_gctf(tomolist, p, gctf_param, write_list):
     """
@@ -148,15 +148,9 @@ def tomoman_gctf(tomolist, p, gctf_param, write_list):
                 cmd = f"cat {os.path.join(tomolist['stack_dir'], 'gctf', 'temp')}/*_gctf.log > {os.path.join(tomolist['stack_dir'], 'gctf', st_name)}_EPA.log"
                 subprocess.run(cmd, shell=True)
             
-            # Concatenate .ctf files
-            ctf_stack = np.zeros((gctf_param['boxsize'], gctf_param['boxsize'], n_img))
-            for j in range(1, n_img + 1):  # 1-based indexing to match MATLAB
-                # String of image number
-                num_str = f"{j:0{digits}d}"
-                # Read image
-                ctf_file = os.path.join(tomolist['stack_dir'], 'gctf', 'temp', f"{st_name}_{num_str}{st_ext}.ctf")
-                temp_img, header = sg_mrcread.sg_mrcread(ctf_file)
-                ctf_stack[:, :, j-1] = temp_img
+            # Concatenate .ctf files, read concurrently into one stack
+            ctf_files = [os.path.join(tomolist['stack_dir'], 'gctf', 'temp', f"{st_name}_{j:0{digits}d}{st_ext}.ctf") for j in range(1, n_img + 1)]  # 1-based indexing to match MATLAB
+            ctf_stack, header = sg_mrcread_many.sg_mrcread_many(ctf_files, dtype=tomoman_precision.tomoman_real_dtype())
             
             sg_mrcwrite.sg_mrcwrite(os.path.join(tomolist['stack_dir'], 'gctf', f"{st_name}.ctf"), ctf_stack, header)
             
@@ -186,4 +180,4 @@ def tomoman_gctf(tomolist, p, gctf_param, write_list):
                 with open(os.path.join(p['root_dir'], p['tomolist_name']), 'wb') as f:
                     pickle.dump(tomolist, f)
     
-    return tomolist
\ No newline at end of file
+    return tomolist
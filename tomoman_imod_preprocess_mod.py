@@ -1,6 +1,9 @@
 import os
 import numpy as np
 import subprocess
+import tomoman_coarse_align as tomoman_coarse_align
+import tomoman_patch_track as tomoman_patch_track
+import tomoman_wbp as tomoman_wbp
 
 def tomoman_imod_preprocess_mod_GQ(tomolist, p, imod_param, write_list):
     """
@@ -44,6 +47,14 @@ def tomoman_imod_preprocess_mod_GQ(tomolist, p, imod_param, write_list):
     
     # Perform IMOD preprocessing
     if process:
+        # Pretilt direction follows the collection scheme
+        if imod_param['pretilt'] == 0:
+            angle_offset = 0
+        elif abs(min(tomolist['collected_tilts'])) > abs(max(tomolist['collected_tilts'])):
+            angle_offset = imod_param['pretilt']
+        else:
+            angle_offset = -imod_param['pretilt']
+
         print(f"TOMOMAN: Initializing batch processing for stack {tomolist['dose_filtered_stack_name']}")
         
         if imod_param['force_imod']:
@@ -80,10 +91,7 @@ def tomoman_imod_preprocess_mod_GQ(tomolist, p, imod_param, write_list):
             if imod_param['coarsealign'] == 1:
                 # pretilt
                 if imod_param['pretilt'] != 0:
-                    if abs(min(tomolist['collected_tilts'])) > abs(max(tomolist['collected_tilts'])):
-                        adoc.write(f"comparam.xcorr.tiltxcorr.AngleOffset={imod_param['pretilt']}\n")
-                    else:
-                        adoc.write(f"comparam.xcorr.tiltxcorr.AngleOffset=-{imod_param['pretilt']}\n")
+                    adoc.write(f"comparam.xcorr.tiltxcorr.AngleOffset={angle_offset}\n")
                 
                 # trimming
                 if imod_param['trimming'] != 0:
@@ -131,7 +139,7 @@ def tomoman_imod_preprocess_mod_GQ(tomolist, p, imod_param, write_list):
                 endnum = 6
             
             # Positioning
-            if imod_param['positioning'] == 1:
+            if imod_param['positioning'] == 1 and not imod_param.get('native_positioning', 0):
                 adoc.write("runtime.Positioning.any.sampleType=0\n")
                 adoc.write("runtime.Positioning.any.wholeTomogram=1\n")
                 adoc.write("runtime.Positioning.any.binByFactor=8\n")
@@ -140,12 +148,54 @@ def tomoman_imod_preprocess_mod_GQ(tomolist, p, imod_param, write_list):
         
         # Run batchtomorun
         print("TOMOMAN: Running IMOD preprocessing...")
-        subprocess.run([
-            'batchruntomo', 
-            '-directive', adoc_path, 
-            '-end', str(endnum)
-        ])
+        name = os.path.splitext(os.path.basename(tomolist['dose_filtered_stack_name']))[0]
+        start = 0
+        if imod_param['coarsealign'] == 1 and imod_param.get('native_coarsealign', 0):
+            # Setup and preprocessing, then native coarse alignment in place of tiltxcorr (step 2)
+            run_batchruntomo(adoc_path, start, 1)
+            tomoman_coarse_align.tomoman_coarse_align(os.path.join(tomolist['stack_dir'], tomolist['dose_filtered_stack_name']),
+                                                      os.path.join(tomolist['stack_dir'], f"{name}.rawtlt"),
+                                                      os.path.join(tomolist['stack_dir'], f"{name}.prexf"),
+                                                      tilt_axis_angle=tomolist['tilt_axis_angle'],
+                                                      binning=imod_param['coarsealignbin'],
+                                                      angle_offset=angle_offset,
+                                                      trimming=imod_param['trimming'],
+                                                      prexg_name=os.path.join(tomolist['stack_dir'], f"{name}.prexg"),
+                                                      n_workers=imod_param.get('coarsealign_workers', 8))
+            start = 3
+
+        if imod_param['patchtrack'] == 1 and imod_param.get('native_patchtrack', 0):
+            # Up to the prealigned stack, then native patch tracking in place of step 4
+            run_batchruntomo(adoc_path, start, 3)
+            tomoman_patch_track.tomoman_patch_track(os.path.join(tomolist['stack_dir'], f"{name}.preali"),
+                                                    os.path.join(tomolist['stack_dir'], f"{name}.rawtlt"),
+                                                    os.path.join(tomolist['stack_dir'], f"{name}.fid"),
+                                                    patch_size=(imod_param['patchsizeX'], imod_param['patchsizeY']),
+                                                    overlap=imod_param['OverlapOfPatchesXandY'],
+                                                    iterations=imod_param['IterateCorrelations'],
+                                                    tilt_axis_angle=tomolist['tilt_axis_angle'],
+                                                    input_binning=imod_param['coarsealignbin'],
+                                                    angle_offset=angle_offset,
+                                                    trimming=imod_param['trimming'],
+                                                    n_workers=imod_param.get('patchtrack_workers', 8))
+            start = 6
+
+        if endnum >= start:
+            run_batchruntomo(adoc_path, start, endnum)
         print(f"TOMOMAN: IMOD preprocessing on stack {tomolist['dose_filtered_stack_name']} complete!!!!")
+
+        # Native bin-8 positioning tomogram
+        if imod_param['positioning'] == 1 and imod_param.get('native_positioning', 0):
+            xf_name = os.path.join(tomolist['stack_dir'], f"{name}.xf")
+            tlt_name = os.path.join(tomolist['stack_dir'], f"{name}.tlt")
+            if not os.path.exists(tlt_name):
+                tlt_name = os.path.join(tomolist['stack_dir'], f"{name}.rawtlt")
+            if not os.path.exists(xf_name):
+                print(f"ACHTUNG!!! {name}.xf not found!!! Positioning tomogram will be reconstructed from the unaligned stack...")
+                xf_name = None
+            tomoman_wbp.tomoman_wbp(os.path.join(tomolist['stack_dir'], tomolist['dose_filtered_stack_name']), tlt_name,
+                                    os.path.join(tomolist['stack_dir'], f"{name}_bin8_wbp.rec"), xf_name=xf_name,
+                                    binning=8, thickness=1600, n_workers=imod_param.get('wbp_workers', 8))
         
         # Update tomolist
         tomolist['imod_preprocessed'] = True
@@ -156,4 +206,16 @@ def tomoman_imod_preprocess_mod_GQ(tomolist, p, imod_param, write_list):
             with open(os.path.join(p['root_dir'], p['tomolist_name']), 'wb') as f:
                 pickle.dump(tomolist, f)
 
-    return tomolist
\ No newline at end of file
+    return tomolist
+
+
+def run_batchruntomo(adoc_path, start, end):
+    """
+    Run batchruntomo from step start to step end.
+    """
+    subprocess.run([
+        'batchruntomo',
+        '-directive', adoc_path,
+        '-start', str(start),
+        '-end', str(end)
+    ])
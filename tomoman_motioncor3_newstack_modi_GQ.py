@@ -1,16 +1,21 @@
 import os
+import contextlib
 import numpy as np
 from scipy.io import savemat, loadmat
 from skimage.transform import resize
 import tomoman_motioncor3_batch_wrapper_modi_GQ as wrapper
-import sg_mrcread as mrcread
+import sg_mrcread_many as mrcread_many
 import tom_mirror as mirror
 import sg_generate_mrc_header as sg_generate_mrc_header
 import sg_append_mrc_label_enhanced as sg_append_mrc_label_enhanced
-import sg_mrcwrite as mrcwrite
+import sg_mrc_stream_writer as sg_mrc_stream_writer
 import dlmwrite as dlmwrite
 import tomoman_resize_stack as resize_stack
-def tomoman_motioncor3_newstack_modi_GQ(tomolist, p, a, mc3, write_list):
+import tomoman_prefetch as tomoman_prefetch
+import tomoman_function_dose_filter_stack as tomoman_function_dose_filter_stack
+import tomoman_precision as tomoman_precision
+import tomoman_preview_cache as tomoman_preview_cache
+def tomoman_motioncor3_newstack_modi_GQ(tomolist, p, a, mc3, write_list, df=None):
     """
     A function for looping through a tomolist and running MotionCor3 on the
     frames and generating a new, properly ordered, stack.
@@ -21,6 +26,9 @@ def tomoman_motioncor3_newstack_modi_GQ(tomolist, p, a, mc3, write_list):
     a (dict): A dictionary containing parameters.
     mc3 (dict): A dictionary containing parameters.
     write_list (bool): Whether to save the updated tomolist.
+    df (dict, optional): Dose filter parameters. If given and mc3['fused_dose_filter']
+        is set, the TOMOMAN exposure-filtered stack is written in the same pass
+        as the new stack, so tomoman_exposure_filter does not have to read it back.
 
     Returns:
     list: Updated tomolist with updated stack parameters.
@@ -87,33 +95,77 @@ def tomoman_motioncor3_newstack_modi_GQ(tomolist, p, a, mc3, write_list):
             stack_types.append('dose_filt')
             num_stacks = 2
         
-        # Generate stacks
-        new_stack = {}
+        # Fused exposure filtering with the TOMOMAN filters
+        fused = bool(mc3.get('fused_dose_filter', 0)) and df is not None
+        if fused and mc3['dose_filter']:
+            print('ACHTUNG!!! MotionCor3 dose filtering is enabled... Skipping fused TOMOMAN exposure filtering!!!')
+            fused = False
+        if fused and df['filter_frames']:
+            print('ACHTUNG!!! Frame-level exposure filtering is enabled... Skipping fused TOMOMAN exposure filtering!!!')
+            fused = False
+        if fused:
+            # Exposure filter parameters, as in tomoman_exposure_filter
+            if df.get('a') is None or df.get('b') is None or df.get('c') is None:
+                df_abc = (0.245, -1.665, 2.81)
+            else:
+                df_abc = (df['a'], df['b'], df['c'])
+            
+            # Doses in stack order; images are always written in ascending tilt order
+            doses = [tomolist['dose'][idx] + df['preexposure'] for idx in unsorted_idx]
+            
+            # Dose-filtered stack name
+            st_name, st_ext = os.path.splitext(stack_names[0])
+            df_stack_name = f"{st_name}{df['dfilt_append']}{st_ext}"
+            dose_str = f"{tomolist['dose'][0]/tomolist['cumulative_exposure_time'][0]:.4f}"
+        
+        # Generate stacks, streaming each tilt to disk
         for j in range(num_stacks):
-                        
-            for k in range(n_tilts):
-                
-                img = mrcread.sg_mrcread(f"{mc3_dir}{tomo_str}_{k}.mrc")
+            
+            header = sg_generate_mrc_header.sg_generate_mrc_header()
+            header = sg_append_mrc_label_enhanced.sg_append_mrc_label(header, 'TOMOMAN: Frames aligned with MotionCor3.')
+            
+            # Images are read concurrently in batches; the next batch is read and previous images written in the background
+            read_names = [f"{mc3_dir}{tomo_str}_{k}.mrc" for k in range(n_tilts)]
+            batch_size = mc3.get('read_batch', 8)
+            batches = [read_names[k:k + batch_size] for k in range(0, n_tilts, batch_size)]
+            with contextlib.ExitStack() as outputs:
+                writer = outputs.enter_context(sg_mrc_stream_writer.sg_mrc_stream_writer(os.path.join(tomolist['stack_dir'], stack_names[j]), header, mode=mc3.get('output_mode'), pixelsize=tomolist['pixelsize']))
+                sink = outputs.enter_context(tomoman_prefetch.tomoman_write_behind(writer.append))
                 
-      
-                if k == 0:
- 
-                    new_stack[stack_types[j]] = np.zeros((a['image_size'][0], a['image_size'][1], n_tilts), dtype=img[0].dtype)
+                # Second output for the fused exposure-filtered stack
+                df_sink = None
+                if fused and j == 0:
+                    print(f'TOMOMAN: Exposure filtering stack {tomo_str} while writing!!!')
+                    df_header = sg_append_mrc_label_enhanced.sg_append_mrc_label(dict(header, labl=list(header['labl'])), f"TOMOMAN: Exposure filtered on images with {dose_str} e/(A^2)/s")
+                    df_writer = outputs.enter_context(sg_mrc_stream_writer.sg_mrc_stream_writer(os.path.join(tomolist['stack_dir'], df_stack_name), df_header, mode=df.get('output_mode', 2), pixelsize=tomolist['pixelsize']))
+                    df_sink = outputs.enter_context(tomoman_prefetch.tomoman_write_behind(df_writer.append))
                 
-        
-                img = resize_stack.tomoman_resize_stack(img[0], a['image_size'][0], a['image_size'][1], True)
-                if tomolist['mirror_stack'] != 'n' or not tomolist['mirror_stack']:
-                    img = mirror.tom_mirror(img, tomolist['mirror_stack'])
+                n = 0
+                for batch in tomoman_prefetch.tomoman_prefetch(lambda names: mrcread_many.sg_mrcread_many(names, dtype=tomoman_precision.tomoman_real_dtype())[0], batches):
                     
-                new_stack[stack_types[j]][:,:,k] = np.squeeze(img) 
-        
-            # Write outputs
-            header = sg_generate_mrc_header.sg_generate_mrc_header()
-            header = sg_append_mrc_label_enhanced.sg_append_mrc_label(header, 'TOMOMAN: Frames aligned with MotionCor3.')
-            for j in range(num_stacks):
-                mrcwrite.sg_mrcwrite(os.path.join(tomolist['stack_dir'], stack_names[j]), new_stack[stack_types[j]], header, pixelsize=tomolist['pixelsize'])
-                stname = os.path.splitext(os.path.basename(stack_names[j]))[0]
-                dlmwrite.dlmwrite(os.path.join(tomolist['stack_dir'], stname + '.rawtlt'), sorted_tilts)
+                    # Resize and mirror the whole batch at once
+                    batch = resize_stack.tomoman_resize_stack(batch, a['image_size'][0], a['image_size'][1], True)
+                    if tomolist['mirror_stack'] in ['x', 'y']:
+                        batch = mirror.tom_mirror(batch, tomolist['mirror_stack'])
+                    
+                    for k in range(batch.shape[2]):
+                        
+                        img = batch[:, :, k:k+1]
+                        sink.put(img)
+                        
+                        if df_sink is not None:
+                            df_sink.put(tomoman_function_dose_filter_stack.tomoman_dose_filter_image(img[:, :, 0], tomolist['pixelsize'], doses[n], *df_abc))
+                        n += 1
+            
+            # Previews of the new stack
+            if j == 0 and p.get('preview_cache', 0):
+                tomoman_preview_cache.tomoman_update_previews(os.path.join(tomolist['stack_dir'], stack_names[j]), p)
+            
+            # Write rawtlt
+            stname = os.path.splitext(os.path.basename(stack_names[j]))[0]
+            dlmwrite.dlmwrite(os.path.join(tomolist['stack_dir'], stname + '.rawtlt'), sorted_tilts)
+            if fused and j == 0:
+                dlmwrite.dlmwrite(os.path.join(tomolist['stack_dir'], f"{st_name}{df['dfilt_append']}.rawtlt"), sorted_tilts)
             
         # Update tomolist
         tomolist['image_size'] = a['image_size']
@@ -124,6 +176,10 @@ def tomoman_motioncor3_newstack_modi_GQ(tomolist, p, a, mc3, write_list):
             tomolist['dose_filtered'] = True
             tomolist['dose_filtered_stack_name'] = stack_names  [1]
             tomolist['dose_filter_algorithm'] = 'MotionCor3'
+        elif fused:
+            tomolist['dose_filtered'] = True
+            tomolist['dose_filtered_stack_name'] = df_stack_name
+            tomolist['dose_filter_algorithm'] = 'TOMOMAN-images'
         
         # Save tomolist
         if write_list:
@@ -0,0 +1,126 @@
+import os
+import pickle
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import sg_read_mrc_header as sg_read_mrc_header
+
+# Catalog columns and their types
+catalog_columns = [
+    ('path', object),
+    ('nx', np.int32),
+    ('ny', np.int32),
+    ('nz', np.int32),
+    ('mode', np.int32),
+    ('pixelsize', np.float32),
+    ('file_size', np.int64),
+    ('mtime', np.float64),
+]
+
+
+def tomoman_mrc_catalog(root_dir, extensions=('.mrc', '.st', '.ali', '.rec', '.mrcs'), n_workers=16, cache_name='mrc_catalog.pkl', refresh=False):
+    """
+    Scan a directory tree for MRC files and return a table of their headers.
+
+    Only the 1024-byte headers are read, using a thread pool. Results are
+    cached in root_dir, keyed by path, file size and mtime, so that re-scans
+    only read headers of new or modified files.
+
+    Parameters:
+    -----------
+    root_dir : str
+        Directory to scan (e.g. the TOMOMAN root_dir)
+    extensions : tuple of str
+        File extensions to include
+    n_workers : int
+        Number of threads used to read headers
+    cache_name : str
+        Cache filename, relative to root_dir. Set to None to disable caching.
+    refresh : bool
+        Ignore any existing cache and re-read all headers
+
+    Returns:
+    --------
+    catalog : dict
+        Columnar table of numpy arrays with the fields path, nx, ny, nz, mode,
+        pixelsize, file_size and mtime. Rows are sorted by path.
+    """
+    # Load cache
+    cache = {}
+    cache_path = os.path.join(root_dir, cache_name) if cache_name else None
+    if cache_path and os.path.exists(cache_path) and not refresh:
+        try:
+            with open(cache_path, 'rb') as f:
+                cache = pickle.load(f)
+        except Exception as e:
+            print(f"ACHTUNG!!! Could not load catalog cache {cache_path}: {e}")
+            cache = {}
+
+    # Find files
+    extensions = tuple(ext.lower() for ext in extensions)
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        for filename in filenames:
+            if filename.lower().endswith(extensions):
+                paths.append(os.path.join(dirpath, filename))
+    paths.sort()
+
+    # Read new or modified headers in parallel
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        rows = list(executor.map(lambda path: catalog_row(path, cache.get(path)), paths))
+
+    rows = [row for row in rows if row is not None]
+    n_read = sum(1 for row in rows if cache.get(row['path']) is not row)
+    print(f"TOMOMAN: {len(rows)} MRC files cataloged in {root_dir} ({n_read} headers read)...")
+
+    # Save cache
+    if cache_path:
+        try:
+            with open(cache_path, 'wb') as f:
+                pickle.dump({row['path']: row for row in rows}, f)
+        except Exception as e:
+            print(f"ACHTUNG!!! Could not write catalog cache {cache_path}: {e}")
+
+    # Assemble columns
+    catalog = {}
+    for name, dtype in catalog_columns:
+        catalog[name] = np.array([row[name] for row in rows], dtype=dtype)
+
+    return catalog
+
+
+def catalog_row(path, cached_row=None):
+    """
+    Return the catalog row of a file, reusing the cached row if the file is unchanged.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    if cached_row is not None and cached_row['mtime'] == stat.st_mtime and cached_row['file_size'] == stat.st_size:
+        return cached_row
+
+    try:
+        header = sg_read_mrc_header.sg_read_mrc_header(path)
+    except Exception as e:
+        print(f"ACHTUNG!!! Could not read header of {path}: {e}")
+        return None
+
+    # Pixel size from cell dimensions
+    if header['mx'] > 0:
+        pixelsize = float(header['xlen']) / float(header['mx'])
+    else:
+        pixelsize = np.nan
+
+    row = {
+        'path': path,
+        'nx': int(header['nx']),
+        'ny': int(header['ny']),
+        'nz': int(header['nz']),
+        'mode': int(header['mode']),
+        'pixelsize': pixelsize,
+        'file_size': stat.st_size,
+        'mtime': stat.st_mtime,
+    }
+
+    return row
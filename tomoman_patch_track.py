@@ -0,0 +1,240 @@
+import os
+import subprocess
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from numpy.lib.stride_tricks import sliding_window_view
+import sg_mrcread as sg_mrcread
+import tomoman_apply_xf as tomoman_apply_xf
+import tomoman_bin_stack as tomoman_bin_stack
+import tomoman_coarse_align as tomoman_coarse_align
+import tomoman_precision as tomoman_precision
+
+
+def tomoman_patch_track(stack_name, tlt_name, fid_name, patch_size=(300, 300), overlap=0.45, iterations=4, tilt_axis_angle=0.0, xf_name=None, input_binning=1, binning=1, angle_offset=0.0, trimming=0, taper_fraction=0.1, radial=(0.25, 0.05), sigma1=0.03, method='fourier', n_workers=8, image_name=None):
+    """
+    Track a grid of patches through a tilt series and write them as an IMOD
+    fiducial model for tiltalign, as patch tracking with tiltxcorr does.
+
+    Patches are laid out with the given overlap on the reference (zero)
+    tilt and tracked outwards, tilt by tilt. For each tilt pair, all
+    patches are cut from a strided view of the two images and correlated
+    with one batched FFT. The tilt further from zero is cosine stretched
+    perpendicular to the tilt axis, and each correlation is iterated by
+    re-extracting the patches at the updated positions. Patches that leave
+    the image end their contour.
+
+    Tracked points are written as a point file (object contour x y z, with
+    z the 0-based tilt index) in pixels of the input stack, and converted to
+    a model with IMOD point2model.
+
+    Parameters:
+    -----------
+    stack_name : str
+        Path of the tilt stack, e.g. the prealigned stack (.preali)
+    tlt_name : str
+        Path of the .tlt or .rawtlt file
+    fid_name : str
+        Path of the output fiducial model
+    patch_size : tuple
+        Patch size in X and Y in unbinned pixels (SizeOfPatchesXandY)
+    overlap : float
+        Fractional overlap of neighbouring patches (OverlapOfPatchesXandY)
+    iterations : int
+        Number of correlations per patch and tilt (IterateCorrelations)
+    tilt_axis_angle : float
+        Rotation of the tilt axis from the Y axis (degrees, counterclockwise).
+        Prealigned stacks are only translated, so this is the tilt-axis angle
+        of the raw stack (tomolist['tilt_axis_angle'])
+    xf_name : str, optional
+        Path of transforms to apply first (e.g. .prexg for a raw stack)
+    input_binning : int
+        Binning of the input stack relative to the unbinned data
+    binning : int
+        Additional binning for tracking
+    angle_offset : float
+        Offset added to all tilt angles, e.g. the lamella pretilt
+    trimming : int
+        Border in unbinned pixels without patches
+    taper_fraction : float
+        Fraction of the patch size over which patch edges are tapered
+    radial : tuple
+        Cutoff and Gaussian falloff of the low-pass filter (cycles/pixel)
+    sigma1 : float
+        Gaussian sigma of the high-pass filter (cycles/pixel)
+    method : str
+        Binning method, 'fourier' or 'block'
+    n_workers : int
+        Number of threads
+    image_name : str, optional
+        Image file passed to point2model -image for the model header
+        (default: stack_name)
+
+    Returns:
+    --------
+    points : ndarray
+        Tracked positions (n_patches, n_tilts, 2) in pixels of the input
+        stack; NaN where a patch was lost
+    """
+    binning = int(binning)
+    stack = sg_mrcread.sg_mrcread(stack_name)[0]
+    n_tilts = stack.shape[2]
+
+    angles = np.loadtxt(tlt_name, ndmin=1) + angle_offset
+    if len(angles) != n_tilts:
+        raise ValueError(f"ACHTUNG!!! {tlt_name} has {len(angles)} tilt angles, but {stack_name} has {n_tilts} tilts!!!")
+
+    if xf_name is not None:
+        xf = tomoman_apply_xf.tomoman_read_xf(xf_name)
+        if xf.shape[0] != n_tilts:
+            raise ValueError(f"ACHTUNG!!! {xf_name} has {xf.shape[0]} transforms, but {stack_name} has {n_tilts} tilts!!!")
+
+    # Sizes in pixels of the tracked images
+    scale = int(input_binning) * binning
+    patch = np.array([max(int(round(n / scale)), 8) for n in patch_size])
+    border = int(trimming) // scale
+
+    ref = int(np.argmin(np.abs(angles)))
+    phi = np.deg2rad(tilt_axis_angle)
+    normal = np.array([np.cos(phi), np.sin(phi)])
+
+    def stretch_matrix(i, j):
+        # Maps tilt i onto the foreshortening of tilt j
+        stretch = np.cos(np.deg2rad(angles[j])) / np.cos(np.deg2rad(angles[i]))
+        return np.eye(2) + (stretch - 1) * np.outer(normal, normal)
+
+    def prepare_tilt(i):
+        if xf_name is not None:
+            img = tomoman_apply_xf.tomoman_transform_image(stack[:, :, i], xf[i], binning, method=method)
+        else:
+            img = tomoman_bin_stack.tomoman_bin_image(stack[:, :, i], binning, method)
+        if i == ref:
+            return img, img
+        j = i + 1 if i < ref else i - 1
+        mov = tomoman_apply_xf.tomoman_transform_image(img, np.concatenate([stretch_matrix(i, j).ravel(), [0, 0]]))
+        return img, mov
+
+    print(f"TOMOMAN: Patch tracking {stack_name}...")
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        images, stretched = zip(*executor.map(prepare_tilt, range(n_tilts)))
+
+    shape = np.array(images[0].shape)
+    center = shape / 2
+    window = tomoman_coarse_align.tomoman_taper_window(tuple(patch), taper_fraction)
+    xcorr_filter = tomoman_coarse_align.tomoman_xcorr_filter(tuple(patch), radial, sigma1)
+
+    # Patch grid on the reference tilt, as patch centers in pixel-edge coordinates
+    grid = tomoman_patch_grid(shape, patch, overlap, border)
+    points = np.full((len(grid), n_tilts, 2), np.nan)
+    points[:, ref] = grid
+
+    # Track outwards from the reference tilt
+    for order in [range(ref + 1, n_tilts), range(ref - 1, -1, -1)]:
+        for i in order:
+            j = i - 1 if i > ref else i + 1
+            valid = ~np.isnan(points[:, j, 0])
+            if not np.any(valid):
+                break
+
+            # Positions in tilt j are found in stretched tilt i at the same place
+            pos = tomoman_track_patches(images[j], stretched[i], points[valid, j], patch, iterations, window, xcorr_filter)
+
+            # Undo the stretch about the image center
+            a = stretch_matrix(i, j)
+            new_pos = (pos - center) @ np.linalg.inv(a).T + center
+            lost = np.isnan(pos[:, 0]) | np.any(new_pos - patch / 2 < 0, axis=1) | np.any(new_pos + patch / 2 > shape, axis=1)
+            new_pos[lost] = np.nan
+            points[valid, i] = new_pos
+
+    # Coordinates in pixels of the input stack
+    points *= binning
+
+    pts_name = os.path.splitext(fid_name)[0] + '.pts'
+    tomoman_write_point_file(pts_name, points)
+    print(f"TOMOMAN: Converting {len(grid)} patch tracks to {fid_name}...")
+    subprocess.run([
+        'point2model',
+        '-open',
+        '-image', image_name if image_name is not None else stack_name,
+        '-input', pts_name,
+        '-output', fid_name
+    ])
+
+    return points
+
+
+def tomoman_patch_grid(shape, patch, overlap, border=0):
+    """
+    Centers of a regular grid of patches with fractional overlap inside the
+    image, excluding the border.
+    """
+    axes = []
+    for n, p in zip(shape, patch):
+        step = max(int(round(p * (1 - overlap))), 1)
+        usable = n - 2 * border - p
+        if usable < 0:
+            raise ValueError(f"ACHTUNG!!! Patch size {p} does not fit in image size {n} with a border of {border}!!!")
+        n_patches = usable // step + 1
+
+        # Center the grid in the usable area
+        start = border + (usable - (n_patches - 1) * step) // 2
+        axes.append(start + np.arange(n_patches) * step + p / 2)
+
+    gx, gy = np.meshgrid(axes[0], axes[1], indexing='ij')
+    return np.stack([gx.ravel(), gy.ravel()], axis=1)
+
+
+def tomoman_extract_patches(image, corners, patch):
+    """
+    Cut patches with the given lower corners from one strided view of an
+    image. Corners are clipped to the image.
+    """
+    windows = sliding_window_view(image, tuple(patch))
+    cx = np.clip(corners[:, 0], 0, windows.shape[0] - 1)
+    cy = np.clip(corners[:, 1], 0, windows.shape[1] - 1)
+    return windows[cx, cy]
+
+
+def tomoman_track_patches(ref_image, mov_image, positions, patch, iterations, window, xcorr_filter):
+    """
+    Find the positions in mov_image of patches centered at the given
+    positions in ref_image by iterated, batched cross-correlation.
+
+    Returns the positions (n, 2), with NaN where a patch left the image.
+    """
+    real_dtype = tomoman_precision.tomoman_real_dtype()
+    shape = np.array(mov_image.shape)
+    corners = np.round(positions - patch / 2).astype(np.intp)
+    refs = tomoman_extract_patches(np.asarray(ref_image, dtype=real_dtype), corners, patch)
+    refs = (refs - refs.mean(axis=(1, 2), keepdims=True)) * window
+
+    mov_image = np.asarray(mov_image, dtype=real_dtype)
+    offsets = np.zeros(positions.shape)
+    shifts = np.zeros(positions.shape)
+    for _ in range(max(int(iterations), 1)):
+        # Re-extract at the nearest whole-pixel position found so far
+        step = np.round(offsets + shifts)
+        mov_corners = corners + step.astype(np.intp)
+        movs = tomoman_extract_patches(mov_image, mov_corners, patch)
+        movs = (movs - movs.mean(axis=(1, 2), keepdims=True)) * window
+
+        # refs(r) = movs(r - shift): the patch is found at -shift in the moving window
+        offsets = step
+        shifts = -tomoman_coarse_align.tomoman_batch_xcorr(refs, movs, xcorr_filter)
+
+    pos = positions + offsets + shifts
+    outside = np.any(mov_corners < 0, axis=1) | np.any(mov_corners + patch > shape, axis=1)
+    pos[outside] = np.nan
+
+    return pos
+
+
+def tomoman_write_point_file(pts_name, points):
+    """
+    Write tracked points as an IMOD point file with one contour per patch:
+    object, contour, x, y, z, with z the tilt index.
+    """
+    with open(pts_name, 'w') as f:
+        for c, track in enumerate(points):
+            for z, (x, y) in enumerate(track):
+                if not np.isnan(x):
+                    f.write(f"{1:6d}{c + 1:6d}{x:12.3f}{y:12.3f}{z:8d}\n")
@@ -0,0 +1,54 @@
+import numpy as np
+
+# Floating point precision shared by all image-processing stages
+precision_settings = {
+    'real': np.dtype(np.float32),
+    'complex': np.dtype(np.complex64)
+}
+
+precision_dtypes = {
+    'single': (np.float32, np.complex64),
+    'double': (np.float64, np.complex128)
+}
+
+
+def tomoman_set_precision(precision):
+    """
+    Set the floating point precision used by the image-processing stages.
+
+    Parameters:
+    -----------
+    precision : str
+        'single' (float32/complex64, default) or 'double' (float64/complex128)
+    """
+    if precision not in precision_dtypes:
+        raise ValueError(f"ACHTUNG!!! Invalid precision: {precision}!!! Options are 'single' and 'double'!!!")
+
+    real, complex_ = precision_dtypes[precision]
+    precision_settings['real'] = np.dtype(real)
+    precision_settings['complex'] = np.dtype(complex_)
+
+
+def tomoman_real_dtype():
+    """
+    Return the real dtype of the current precision.
+    """
+    return precision_settings['real']
+
+
+def tomoman_complex_dtype():
+    """
+    Return the complex dtype of the current precision.
+    """
+    return precision_settings['complex']
+
+
+def tomoman_as_real(array):
+    """
+    Cast floating point arrays to the current precision; integer arrays are
+    returned unchanged. No copy is made if the dtype already matches.
+    """
+    array = np.asarray(array)
+    if np.issubdtype(array.dtype, np.floating):
+        return array.astype(precision_settings['real'], copy=False)
+    return array
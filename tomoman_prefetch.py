@@ -0,0 +1,122 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def tomoman_prefetch(read_fn, items, depth=1):
+    """
+    Iterate over read_fn(item) for each item, reading ahead on a background thread.
+
+    While the caller processes the result for item N, the reads of the next
+    'depth' items are already running, so disk I/O overlaps with computation.
+    Results are returned in order. read_fn must fully load its data (e.g.
+    np.array(...) of a memory-mapped stack), otherwise the actual I/O is
+    deferred to the caller's thread.
+
+    Parameters:
+    -----------
+    read_fn : callable
+        Function that reads and returns the data of one item
+    items : iterable
+        Items to read (e.g. file names or tilt indices)
+    depth : int
+        Number of items to read ahead (1 = double buffering)
+
+    Returns:
+    --------
+    generator of read_fn(item)
+    """
+    items = iter(items)
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # Fill read-ahead buffer
+        for item in items:
+            pending.append(executor.submit(read_fn, item))
+            if len(pending) > depth:
+                break
+
+        while pending:
+            data = pending.popleft().result()
+
+            # Queue next read before handing data to the caller
+            for item in items:
+                pending.append(executor.submit(read_fn, item))
+                break
+
+            yield data
+
+
+class tomoman_write_behind:
+    """
+    Asynchronous sink that calls write_fn on a background thread.
+
+    Items passed to put() are written in order while the caller continues
+    processing. At most 'depth' items are queued; put() blocks when the queue
+    is full, which bounds memory use. close() waits for all writes to finish
+    and re-raises any error from the writer thread. Items must not be modified
+    after they are passed to put().
+
+    Usage:
+        with tomoman_write_behind(writer.append) as sink:
+            for img in images:
+                sink.put(process(img))
+
+    Parameters:
+    -----------
+    write_fn : callable
+        Function that writes one item (e.g. sg_mrc_stream_writer.append)
+    depth : int
+        Maximum number of queued items
+    """
+
+    def __init__(self, write_fn, depth=2):
+
+        self.write_fn = write_fn
+        self.queue = queue.Queue(maxsize=depth)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def put(self, item):
+        """
+        Queue an item for writing.
+        """
+        if self.error is not None:
+            raise self.error
+        self.queue.put(item)
+
+    def close(self):
+        """
+        Flush all queued items and stop the writer thread.
+        """
+        if self.thread is None:
+            return
+
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            # After an error, keep draining the queue so put() never blocks
+            if self.error is None:
+                try:
+                    self.write_fn(item)
+                except Exception as e:
+                    self.error = e
@@ -0,0 +1,264 @@
+import os
+import time
+import zlib
+import struct
+import pickle
+import threading
+import numpy as np
+import sg_mrcread as sg_mrcread
+import sg_generate_mrc_header as sg_generate_mrc_header
+import sg_append_mrc_label_enhanced as sg_append_mrc_label_enhanced
+import sg_mrc_stream_writer as sg_mrc_stream_writer
+import tomoman_bin_stack as tomoman_bin_stack
+import tomoman_fft as tomoman_fft
+import tomoman_precision as tomoman_precision
+
+# Name of the cache index inside the cache directory
+index_name = 'preview_index.pkl'
+
+# Serializes index updates within a process
+index_lock = threading.Lock()
+
+
+def tomoman_preview_pyramid(stack_name, cache_dir, binnings=(2, 4, 8, 16), method='block', max_bytes=20 * 1024**3, thumbnail=True):
+    """
+    Return binned preview copies of a stack from an on-disk pyramid cache,
+    building them if they are missing or stale.
+
+    All binning levels and a PNG montage thumbnail are generated in a single
+    pass over the memory-mapped stack. Entries are invalidated when the size
+    or mtime of the source stack changes. When the cache grows beyond
+    max_bytes, least recently used entries are evicted.
+
+    Parameters:
+    -----------
+    stack_name : str
+        Path of the source MRC stack
+    cache_dir : str
+        Cache directory (e.g. next to the tomolist)
+    binnings : tuple of int
+        Binning factors of the preview stacks
+    method : str
+        'block' (fast real-space averaging, each level binned from the previous
+        one) or 'fourier' (one FFT per tilt, all levels Fourier cropped from it)
+    max_bytes : int
+        Upper bound on the size of the cache
+    thumbnail : bool
+        Whether to write a PNG montage of the coarsest level
+
+    Returns:
+    --------
+    previews : dict
+        Paths of the preview stacks keyed by binning factor, and of the
+        thumbnail under 'png'
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    stack_name = os.path.abspath(stack_name)
+    binnings = sorted(int(f) for f in binnings)
+    stat = os.stat(stack_name)
+
+    with index_lock:
+        index = read_index(cache_dir)
+        entry = index.get(stack_name)
+
+        # Check for a valid entry
+        if entry is not None and entry_valid(entry, stat, binnings, thumbnail):
+            entry['last_access'] = time.time()
+            write_index(cache_dir, index)
+            return dict(entry['files'])
+
+    # Build previews
+    print(f"TOMOMAN: Building preview pyramid for {os.path.basename(stack_name)}...")
+    files = build_pyramid(stack_name, cache_dir, binnings, method, thumbnail)
+
+    with index_lock:
+        index = read_index(cache_dir)
+        index[stack_name] = {
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'files': files,
+            'bytes': sum(os.path.getsize(f) for f in files.values()),
+            'last_access': time.time()
+        }
+        evict(index, max_bytes, keep=stack_name)
+        write_index(cache_dir, index)
+
+    return dict(files)
+
+
+def tomoman_update_previews(stack_name, p):
+    """
+    Build or refresh the previews of a stack with the settings in the
+    parameters dictionary (preview_binnings, preview_method, preview_cache_gb).
+    The cache lives in preview_cache/ in the root directory.
+    """
+    cache_dir = os.path.join(p['root_dir'], 'preview_cache')
+    return tomoman_preview_pyramid(stack_name, cache_dir,
+                                   binnings=p.get('preview_binnings', (2, 4, 8, 16)),
+                                   method=p.get('preview_method', 'block'),
+                                   max_bytes=int(p.get('preview_cache_gb', 20) * 1024**3))
+
+
+def entry_valid(entry, stat, binnings, thumbnail):
+    """
+    Check that a cache entry matches its source and that its files exist.
+    """
+    if entry['mtime'] != stat.st_mtime or entry['size'] != stat.st_size:
+        return False
+    if any(f not in entry['files'] for f in binnings) or (thumbnail and 'png' not in entry['files']):
+        return False
+    return all(os.path.exists(f) for f in entry['files'].values())
+
+
+def build_pyramid(stack_name, cache_dir, binnings, method, thumbnail):
+    """
+    Write all preview levels and the thumbnail in one pass over the stack.
+    """
+    stack, header = sg_mrcread.sg_mrcread(stack_name)
+    x, y, n_tilts = stack.shape
+    pixelsize = header['xlen'] / header['mx'] if header['mx'] > 0 else 1.0
+
+    # Unique file prefix per source stack
+    base = os.path.splitext(os.path.basename(stack_name))[0]
+    prefix = os.path.join(cache_dir, f"{base}_{zlib.crc32(stack_name.encode()):08x}")
+    files = {f: f"{prefix}_bin{f}.mrc" for f in binnings}
+
+    writers = []
+    try:
+        for f in binnings:
+            out_header = sg_generate_mrc_header.sg_generate_mrc_header()
+            out_header = sg_append_mrc_label_enhanced.sg_append_mrc_label(out_header, f"TOMOMAN: Preview binned by {f} ({method}).")
+            writers.append(sg_mrc_stream_writer.sg_mrc_stream_writer(files[f], out_header, mode=2, pixelsize=pixelsize * f))
+
+        tiles = []
+        for i in range(n_tilts):
+            levels = bin_levels(stack[:, :, i], binnings, method)
+            for writer, img in zip(writers, levels):
+                writer.append(img)
+            tiles.append(levels[-1])
+    finally:
+        for writer in writers:
+            writer.close()
+
+    if thumbnail and n_tilts > 0:
+        files['png'] = f"{prefix}_montage.png"
+        write_png(files['png'], montage(tiles))
+
+    return files
+
+
+def bin_levels(image, binnings, method):
+    """
+    Bin one image to all pyramid levels.
+    """
+    image = np.asarray(image, dtype=tomoman_precision.tomoman_real_dtype())
+    x, y = image.shape
+    levels = []
+
+    if method == 'fourier':
+        spectrum = tomoman_fft.rfft2(image)
+        for f in binnings:
+            new_shape = (x // f, y // f)
+            levels.append(tomoman_fft.irfft2(tomoman_fft.crop_rfft2(spectrum, (x, y), new_shape), new_shape))
+    elif method == 'block':
+        # Bin each level from the previous one when the factors allow it
+        previous, previous_f = image, 1
+        for f in binnings:
+            if f % previous_f == 0:
+                img = tomoman_bin_stack.tomoman_bin_image(previous, f // previous_f, 'block')
+            else:
+                img = tomoman_bin_stack.tomoman_bin_image(image, f, 'block')
+            levels.append(img)
+            previous, previous_f = img, f
+    else:
+        raise ValueError(f"ACHTUNG!!! Invalid binning method: {method}!!! Options are 'fourier' and 'block'!!!")
+
+    return levels
+
+
+def montage(tiles):
+    """
+    Arrange (x, y) tiles on a grid and scale them to 8-bit grey values.
+    """
+    n = len(tiles)
+    tx, ty = tiles[0].shape
+    n_cols = int(np.ceil(np.sqrt(n)))
+    n_rows = int(np.ceil(n / n_cols))
+
+    # Common contrast from robust percentiles
+    values = np.stack(tiles)
+    low, high = np.percentile(values, [1, 99])
+    scale = 255.0 / (high - low) if high > low else 0.0
+
+    # Rows of the image are y, with y increasing upwards as in 3dmod
+    image = np.zeros((n_rows * ty, n_cols * tx), dtype=np.uint8)
+    for i, tile in enumerate(tiles):
+        r, c = divmod(i, n_cols)
+        grey = np.clip((tile - low) * scale, 0, 255).astype(np.uint8)
+        image[r * ty:(r + 1) * ty, c * tx:(c + 1) * tx] = grey.T[::-1]
+
+    return image
+
+
+def write_png(file_name, image):
+    """
+    Write a 2D uint8 array as an 8-bit greyscale PNG.
+    """
+    height, width = image.shape
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    # Each row starts with filter type 0
+    raw = np.zeros((height, width + 1), dtype=np.uint8)
+    raw[:, 1:] = image
+
+    with open(file_name, 'wb') as fid:
+        fid.write(b'\x89PNG\r\n\x1a\n')
+        fid.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)))
+        fid.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)))
+        fid.write(chunk(b'IEND', b''))
+
+
+def evict(index, max_bytes, keep=None):
+    """
+    Remove least recently used entries until the cache fits in max_bytes.
+    """
+    total = sum(entry['bytes'] for entry in index.values())
+    for name in sorted(index, key=lambda k: index[k]['last_access']):
+        if total <= max_bytes:
+            break
+        if name == keep:
+            continue
+        for f in index[name]['files'].values():
+            if os.path.exists(f):
+                os.remove(f)
+        total -= index[name]['bytes']
+        del index[name]
+        print(f"TOMOMAN: Evicted previews of {os.path.basename(name)} from preview cache...")
+
+
+def read_index(cache_dir):
+    """
+    Load the cache index, or return an empty one.
+    """
+    index_path = os.path.join(cache_dir, index_name)
+    if not os.path.exists(index_path):
+        return {}
+    try:
+        with open(index_path, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        print("ACHTUNG!!! Preview cache index unreadable... Starting new index!!!")
+        return {}
+
+
+def write_index(cache_dir, index):
+    """
+    Atomically replace the cache index.
+    """
+    index_path = os.path.join(cache_dir, index_name)
+    temp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        pickle.dump(index, f)
+    os.replace(temp_path, index_path)
@@ -30,6 +30,15 @@ p['flip_gain'] = 0           # Gain ref flip; 0 = none, 1 = up/down, 2 = left/ri
 p['os'] = 'windows'          # Operating system for data collection. Options are 'windows' and 'linux'
 p['mirror_stack'] = 'n'      # Mirror images. For Titan2, use 'y'. For MiKrios set to 'none'
 
+# Compute parameters
+p['fft_backend'] = 'scipy'   # FFT backend for all Fourier code paths. Options are 'scipy', 'pyfftw' (cached plans) and 'numpy'
+p['fft_workers'] = None      # Number of threads per FFT. None = all cores
+p['preview_cache'] = 0       # 1 = keep binned previews and PNG montages of new stacks in [root_dir]/preview_cache/; 3dmod then opens the cached preview when cleaning
+p['preview_binnings'] = [2, 4, 8, 16]  # Binning factors of preview stacks
+p['preview_method'] = 'block'  # 'block' = fast real-space averaging, 'fourier' = antialiased Fourier cropping
+p['preview_cache_gb'] = 20   # Maximum size of the preview cache; least recently used previews are evicted
+p['precision'] = 'single'    # Floating point precision of image processing. 'single' (float32/complex64) or 'double' (float64/complex128)
+
 # Overrides (set to '' for no override)
 ov = {
     'tilt_axis_angle': 84.63,    # Tilt axis angle in degrees
@@ -44,7 +53,8 @@ batch_mode = 'single'  # 'single' runs a single stack through the whole pipeline
 s = {
     'sort_new': 1,                       # 1 = yes, 0 = no;
     'ignore_raw_stacks': 1,              # Move files even if raw stack is missing
-    'ignore_missing_frames': 0           # Move files even if frames are missing
+    'ignore_missing_frames': 0,          # Move files even if frames are missing
+    'stable_window': 10                  # Seconds a file must be unmodified (and structurally complete) before it is sorted. Incomplete stacks are left for the next sort.
 }
 
 # Stack parameters
@@ -81,7 +91,10 @@ mc3 = {
     'Tilt': [],                          # Specify the starting angle and the step angle of tilt series. They are required for dose weighting. If not given, dose weighting will be disabled.
     'Mag': [],                           # 1. Correct anisotropic magnification by stretching image along the major axis, the axis where the lower magnification is detected. 2. Three inputs are needed including magnifications along major and minor axes and the angle of the major axis relative to the image x-axis in degree. 3. By default no correction is performed.
     'Crop': [],                          # 1. Crop the loaded frames to the given size. 2. By default the original size is loaded.
-    'Gpu': [1, 2]                        # GPU IDs. Default 0. For multiple GPUs, separate IDs by space. For example, -Gpu 0 1 2 3 specifies 4 GPUs.
+    'Gpu': [1, 2],                       # GPU IDs. Default 0. For multiple GPUs, separate IDs by space. For example, -Gpu 0 1 2 3 specifies 4 GPUs.
+    'output_mode': 2,                    # MRC mode of the new stack. 2 = float32, 12 = float16 (half the size), 6 = uint16, 1 = int16
+    'read_batch': 8,                     # Number of aligned images read concurrently when assembling the new stack
+    'fused_dose_filter': 0               # 1 = also write the TOMOMAN exposure-filtered stack (df parameters) while assembling the new stack, saving a second pass over the stack. Requires dose_filter = 0.
 }
 
 # Clean stacks
@@ -89,6 +102,8 @@ c = {
     'clean_stacks': 1,
     'force_cleaning': 0,                 # 1 = yes, 0 = no;
     'clean_binning': 4,                  # Binning to open 3dmod with
+    'native_binning': 0,                 # 1 = bin the stack with tomoman_bin_stack before opening it in 3dmod, instead of binning in 3dmod
+    'binning_method': 'block',           # Native binning method. 'block' = fast real-space averaging, 'fourier' = antialiased Fourier cropping
     'clean_append': ''                   # Append to name for cleaned stack. Setting blank ('') overwrites old file.
 }
 
@@ -101,7 +116,10 @@ df = {
     'preexposure': 0,                    # Pre-exposure prior to initial image collection.
     'a': None,                             # Resolution-dependent critical exposure constant 'a'. Leave emtpy ('') to use default.
     'b': None,                             # Resolution-dependent critical exposure constant 'b'. Leave emtpy ('') to use default.
-    'c': None                              # Resolution-dependent critical exposure constant 'c'. Leave emtpy ('') to use default.
+    'c': None,                             # Resolution-dependent critical exposure constant 'c'. Leave emtpy ('') to use default.
+    'output_mode': 2,                      # MRC mode of the dose-filtered stack. 2 = float32, 12 = float16 (half the size)
+    'binnings': [],                        # Also write binned dose-filtered stacks (e.g. [2, 4, 8]), Fourier cropped from the filtered images. Only when filtering images.
+    'n_workers': 1                         # Processes for image-stack filtering. 1 = stream tilts with constant memory; >1 = filter tilts in parallel, holding about twice the stack in memory
 }
 
 # IMOD preprocess
@@ -118,6 +136,8 @@ imod_param = {
     'coarsealignbin': 4,                # Bin factor for coarse alignment
     'coarseantialias': -1,              # Antialiasing filter for coarse alignment
     'convbyte': '/',                    # Convert to bytes: '/' = no, '0' = yes
+    'native_coarsealign': 0,            # 1 = replace tiltxcorr with tomoman_coarse_align (writes [name].prexf and [name].prexg), honoring pretilt and trimming
+    'coarsealign_workers': 8,           # Threads for native coarse alignment
     'autoseed': 0,                      # Run autofidseed and beadtrack
     'localareatracking': 1,             # Local area bead tracking (1=yes,0=no)
     'localareasize': 1000,              # Size of local area
@@ -133,6 +153,8 @@ imod_param = {
     'patchsizeY': 300,                  # Size of patch used in Y
     'OverlapOfPatchesXandY': 0.45,      # Overlap of patches in x and y
     'IterateCorrelations': 4,           # Number of Iterations 
+    'native_patchtrack': 0,             # 1 = replace tiltxcorr patch tracking with tomoman_patch_track (writes [name].fid from [name].preali with IMOD point2model)
+    'patchtrack_workers': 8,            # Threads for native patch tracking
     'adjustTiltAngles': 1,              # Bool for 'Run again with tilt angle offset from Tiltalign'
     'Align': 1,                         # Run fine alignment steps from etomo
     'RobustFitting': 1,                 # Whether to use robust fitting to downweight some points(bool)
@@ -140,7 +162,9 @@ imod_param = {
     'RotOption': -1,                    # Type of rotation solution (1 solve all; 3 group; -1 solve one; 0 fix)
     'TiltOption': 0,                    # Type of tilt angle solution (1 solve all; 5 group; 0 fix)
     'MagOption': 0,                     # Type of magnification solution (1 solve all; 3 group; 0 fix)
-    'positioning': 0                    # Just creats a bin 8 tomo to do positoining on (Bool)
+    'positioning': 0,                   # Just creats a bin 8 tomo to do positoining on (Bool)
+    'native_positioning': 0,            # 1 = reconstruct the bin 8 positioning tomogram with tomoman_wbp instead of batchruntomo ([name]_bin8_wbp.rec)
+    'wbp_workers': 8                    # Threads for native weighted back-projection
 }
 
 # GCTF
@@ -304,6 +328,14 @@ import tomoman_imod_preprocess_mod as tomoman_imod_preprocess_mod
 
 import tomoman_gctf as tomoman_gctf
 
+import tomoman_fft as tomoman_fft
+
+import tomoman_precision as tomoman_precision
+
+# Set FFT backend and precision
+tomoman_fft.tomoman_fft_set_backend(p['fft_backend'], p['fft_workers'])
+tomoman_precision.tomoman_set_precision(p['precision'])
+
 while t <= n_tilts:
     # Check tomogram parameters
     if st['update_stack'] == 1:
@@ -315,7 +347,7 @@ while t <= n_tilts:
     # Align frames
     if mc3['ali_frames'] == 1:
         # Align frames and generate stack
-        tomolist[t-1] = modi.tomoman_motioncor3_newstack_modi_GQ(tomolist[t-1], p, st, mc3, write_list)
+        tomolist[t-1] = modi.tomoman_motioncor3_newstack_modi_GQ(tomolist[t-1], p, st, mc3, write_list, df)
         # Write tomolist
         with open(os.path.join(p['root_dir'], p['tomolist_name']), 'wb') as f:
             pickle.dump(tomolist, f)
@@ -3,7 +3,9 @@ import datetime
 import pickle
 import shutil
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta
+import sg_fread_mrc_extended_header as sg_fread_mrc_extended_header
+import tomoman_check_file_complete as tomoman_check_file_complete
 
 def tomoman_sort_new_stacks(p, ov, s, tomolist):
     """
@@ -33,6 +35,12 @@ def tomoman_sort_new_stacks(p, ov, s, tomolist):
         stack_num = mdoc_file[len(p['prefix']):-(len(p['raw_stack_ext']) + 5)]
         temp_tomolist['tomo_num'] = int(stack_num)
         
+        # Files still being written during acquisition are skipped until the next sort
+        stable_window = s.get('stable_window', 0)
+        if not tomoman_check_file_complete.tomoman_check_file_complete(os.path.join(p['raw_stack_dir'], mdoc_file), stable_window=stable_window):
+            print(f"TOMOMAN: .mdoc for stack {stack_num} is still being written... Skipping stack {stack_num} for now!!!")
+            continue
+        
         # Check for .mdoc file
         print(f"TOMOMAN: parsing .mdoc for stack {stack_num}")
         
@@ -47,12 +55,28 @@ def tomoman_sort_new_stacks(p, ov, s, tomolist):
             if not s['ignore_raw_stacks']:
                 print(f"ACHTUNG!!! Skipping stack {stack_num}!!!")
                 continue
+        elif not tomoman_check_file_complete.tomoman_check_file_complete(raw_stack_name, stable_window=stable_window):
+            print(f"TOMOMAN: Raw stack for tomogram {stack_num} is still being written... Skipping stack {stack_num} for now!!!")
+            continue
+        
+        # Fall back to the raw stack's extended header if the .mdoc has no sections
+        if n_tilts == 0 and os.path.isfile(raw_stack_name):
+            print(f"TOMOMAN: No sections in .mdoc for stack {stack_num}... reading extended header of raw stack!!!")
+            mdoc_param = parse_extended_header(raw_stack_name)
+            n_tilts = len(mdoc_param)
         
         # Check frames
         frame_names = [None] * n_tilts
+        frames_incomplete = False
         for j in range(n_tilts):
             sub_frame_path = mdoc_param[j]['SubFramePath']
             
+            # Extended headers have no frame paths; there are no frames to check or move
+            if not sub_frame_path:
+                print(f"ACHTUNG!!! No frame path for tilt {j + 1} of stack {stack_num}... Frames will not be moved!!!")
+                frame_names[j] = ''
+                continue
+            
             # Check if path is empty
             clean_path = sub_frame_path.replace('\\', '/')  
             try:
@@ -70,6 +94,13 @@ def tomoman_sort_new_stacks(p, ov, s, tomolist):
                 if not s['ignore_missing_frames']:
                     print(f"ACHTUNG!!! Skipping stack {stack_num}!!!")
                     continue
+            elif not tomoman_check_file_complete.tomoman_check_file_complete(frame_path, stable_window=stable_window):
+                print(f"TOMOMAN: Frame \"{frame_names[j]}\" of stack {stack_num} is still being written...")
+                frames_incomplete = True
+        
+        if frames_incomplete:
+            print(f"TOMOMAN: Skipping stack {stack_num} for now!!!")
+            continue
         
         # Generate new folder
         print(f"Generating directories and moving files for stack {stack_num}!!!")
@@ -97,6 +128,9 @@ def tomoman_sort_new_stacks(p, ov, s, tomolist):
         
         # Move frames
         for j, frame_name in enumerate(frame_names):
+            # Never move the frame directory itself
+            if not frame_name:
+                continue
             try:
                 shutil.move(os.path.join(p['raw_frame_dir'], frame_name), os.path.join(tomo_dir, 'frames/', frame_name))
             except Exception as e:
@@ -315,6 +349,39 @@ def parse_mdoc(mdoc_path, mdoc_fields, mdoc_field_types):
     
     return mdoc_data
 
+def parse_extended_header(raw_stack_name):
+    """
+    Generate .mdoc-style entries from the FEI or SerialEM extended header of
+    a raw stack, for stacks whose .mdoc is missing or incomplete. Frame paths
+    are not stored in extended headers and are left empty.
+    """
+    header, sections = sg_fread_mrc_extended_header.sg_read_mrc_extended_header(raw_stack_name)
+    if sections is None:
+        print(f"ACHTUNG!!! {raw_stack_name} has no supported extended header!!!")
+        return []
+    
+    mdoc_data = []
+    for i, section in enumerate(sections):
+        # Without timestamps, sections are in collection order
+        if np.isnan(section['timestamp']):
+            date_time = datetime(2000, 1, 1) + timedelta(seconds=i)
+        else:
+            date_time = sg_fread_mrc_extended_header.timestamp_to_datetime(section['timestamp'])
+        
+        mdoc_data.append({
+            'TiltAxisAngle': None,
+            'TiltAngle': float(section['tilt_angle']),
+            'ExposureDose': float(section['dose']),
+            'ExposureTime': float(section['exposure_time']),
+            'TargetDefocus': float(section['defocus']),
+            'SubFramePath': '',
+            'NumSubFrames': float('nan'),
+            'PixelSpacing': float(section['pixel_spacing']),
+            'DateTime': date_time.strftime('%d-%b-%y %H:%M:%S'),
+        })
+    
+    return mdoc_data
+
 def tomoman_append_tomolist(tomolist, new_tomolist):
     """
     Append a new tomolist row to the existing tomolist.
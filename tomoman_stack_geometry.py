@@ -0,0 +1,188 @@
+import numpy as np
+
+# Axis of each dimension in (x, y, z) ordered stacks
+stack_axes = {'x': 0, 'y': 1, 'z': 2}
+
+
+def tomoman_center_resize(stack, x, y, padding='mean', out=None):
+    """
+    Center crop and/or pad all images of a stack to a new XY size in one pass.
+
+    Padded areas are filled with the mean of each (cropped) image. With edge
+    padding, the bands beside the image repeat its edge pixels, while the
+    corners keep the mean.
+
+    Parameters:
+    -----------
+    stack : ndarray
+        Image stack (in_x, in_y, n_img)
+    x, y : int
+        Target size
+    padding : str
+        'mean' or 'edge'
+    out : ndarray, optional
+        Output buffer of shape (x, y, n_img)
+
+    Returns:
+    --------
+    out : ndarray
+        Resized stack (x, y, n_img)
+    """
+    if padding not in ['mean', 'edge']:
+        raise ValueError(f"ACHTUNG!!! Invalid padding: {padding}!!! Options are 'mean' and 'edge'!!!")
+
+    in_x, in_y, n_img = stack.shape
+    out = output_buffer(out, (x, y, n_img), stack.dtype)
+
+    # Source and destination ranges
+    (nx1, nx2), (ox1, ox2) = center_ranges(in_x, x)
+    (ny1, ny2), (oy1, oy2) = center_ranges(in_y, y)
+    old = stack[ox1:ox2, oy1:oy2, :]
+
+    # Fill padding with image means
+    if (nx2 - nx1 < x) or (ny2 - ny1 < y):
+        out[...] = np.mean(old, axis=(0, 1), dtype=np.float64)
+
+    out[nx1:nx2, ny1:ny2, :] = old
+
+    if padding == 'edge':
+        if nx1 > 0:
+            out[:nx1, ny1:ny2, :] = old[:1, :, :]
+        if nx2 < x:
+            out[nx2:, ny1:ny2, :] = old[-1:, :, :]
+        if ny1 > 0:
+            out[nx1:nx2, :ny1, :] = old[:, :1, :]
+        if ny2 < y:
+            out[nx1:nx2, ny2:, :] = old[:, -1:, :]
+
+    return out
+
+
+def tomoman_flip_stack(stack, dimsel, out=None):
+    """
+    Flip a stack along the x, y or z axis.
+
+    Without an output buffer, a view of the input is returned.
+
+    Parameters:
+    -----------
+    stack : ndarray
+        Stack (x, y, z)
+    dimsel : str
+        'x', 'y' or 'z'
+    out : ndarray, optional
+        Output buffer of the same shape
+
+    Returns:
+    --------
+    ndarray
+        Flipped stack
+    """
+    if dimsel not in stack_axes:
+        raise ValueError("ACHTUNG!!! Unknown dimension, must be 'x', 'y' or 'z'!!!")
+
+    return view_or_copy(np.flip(stack, axis=stack_axes[dimsel]), out)
+
+
+def tomoman_mirror_stack(stack, dimsel, stmp, out=None):
+    """
+    Mirror a stack about index stmp along the x, y or z axis, wrapping
+    around the edges, i.e. out[i] = stack[(2 * stmp - i) % n].
+
+    Parameters:
+    -----------
+    stack : ndarray
+        Stack (x, y, z)
+    dimsel : str
+        'x', 'y' or 'z'
+    stmp : int
+        Mirror point (0-based index)
+    out : ndarray, optional
+        Output buffer of the same shape
+
+    Returns:
+    --------
+    ndarray
+        Mirrored stack
+    """
+    if dimsel not in stack_axes:
+        raise ValueError("ACHTUNG!!! Unknown dimension, must be 'x', 'y' or 'z'!!!")
+    axis = stack_axes[dimsel]
+
+    # A flip mirrors about (n - 1) / 2; rolling moves the mirror point to stmp
+    n = stack.shape[axis]
+    flipped = np.flip(stack, axis=axis)
+    shift = (2 * int(stmp) - (n - 1)) % n
+    if shift == 0:
+        return view_or_copy(flipped, out)
+
+    out = output_buffer(out, stack.shape, stack.dtype)
+    index = [slice(None)] * stack.ndim
+    index[axis] = slice(shift, None)
+    source = [slice(None)] * stack.ndim
+    source[axis] = slice(None, n - shift)
+    out[tuple(index)] = flipped[tuple(source)]
+    index[axis] = slice(None, shift)
+    source[axis] = slice(n - shift, None)
+    out[tuple(index)] = flipped[tuple(source)]
+
+    return out
+
+
+def tomoman_rot90_stack(stack, k=1, out=None):
+    """
+    Rotate all images of a stack by k * 90 degrees in the XY plane.
+
+    Without an output buffer, a view of the input is returned.
+
+    Parameters:
+    -----------
+    stack : ndarray
+        Stack (x, y, z)
+    k : int
+        Number of counter-clockwise quarter turns
+    out : ndarray, optional
+        Output buffer of the rotated shape
+
+    Returns:
+    --------
+    ndarray
+        Rotated stack
+    """
+    return view_or_copy(np.rot90(stack, k, axes=(0, 1)), out)
+
+
+def center_ranges(in_size, size):
+    """
+    Return the destination and source ranges for center cropping or padding.
+    """
+    if in_size == size:
+        return (0, size), (0, size)
+    elif in_size > size:
+        o1 = int((in_size - size) / 2)
+        return (0, size), (o1, o1 + size)
+    else:
+        n1 = int((size - in_size) / 2)
+        return (n1, n1 + in_size), (0, in_size)
+
+
+def output_buffer(out, shape, dtype):
+    """
+    Check a caller-provided output buffer, or allocate one.
+    """
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if out.shape != tuple(shape):
+        raise ValueError(f"ACHTUNG!!! Output buffer has size {out.shape}, but {tuple(shape)} was expected!!!")
+    return out
+
+
+def view_or_copy(view, out):
+    """
+    Return a view, or copy it into a caller-provided output buffer.
+    """
+    if out is None:
+        return view
+    out = output_buffer(out, view.shape, view.dtype)
+    out[...] = view
+    return out
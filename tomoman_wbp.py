@@ -0,0 +1,209 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import sg_mrcread as sg_mrcread
+import sg_generate_mrc_header as sg_generate_mrc_header
+import sg_append_mrc_label_enhanced as sg_append_mrc_label_enhanced
+import sg_mrc_stream_writer as sg_mrc_stream_writer
+import tomoman_apply_xf as tomoman_apply_xf
+import tomoman_bin_stack as tomoman_bin_stack
+import tomoman_fft as tomoman_fft
+import tomoman_precision as tomoman_precision
+
+
+def tomoman_wbp(stack_name, tlt_name, output_name, xf_name=None, binning=8, thickness=1600, method='fourier', radial=(0.35, 0.035), slab_size=32, n_workers=8, mode=None):
+    """
+    Reconstruct a low-resolution tomogram by weighted back-projection.
+
+    Tilts are read from the memory-mapped stack, aligned with the .xf
+    transforms and binned, then R-weighted. The tomogram is back-projected
+    in Z slabs in parallel threads, and slabs are streamed to the output in
+    order, so memory use is bounded by the binned stack and a few slabs.
+
+    The tilt axis of the aligned stack is along Y. The tomogram is written
+    with Z as the thickness axis, as after trimvol -rx.
+
+    Parameters:
+    -----------
+    stack_name : str
+        Path of the tilt stack (e.g. the dose-filtered stack)
+    tlt_name : str
+        Path of the .tlt file with one tilt angle per tilt (degrees)
+    output_name : str
+        Path of the tomogram
+    xf_name : str, optional
+        Path of the .xf file. Without it, the stack is assumed to be aligned
+        with the tilt axis along Y.
+    binning : int
+        Binning factor of the tomogram
+    thickness : int
+        Thickness of the tomogram in unbinned pixels
+    method : str
+        Binning method, 'fourier' or 'block'
+    radial : tuple
+        Cutoff and Gaussian falloff of the R-weighting filter in cycles/pixel
+        of the binned stack, as the RADIAL option of IMOD tilt
+    slab_size : int
+        Number of Z sections back-projected per task
+    n_workers : int
+        Number of threads
+    mode : int, optional
+        Output MRC mode (default: from the data type)
+
+    Returns:
+    --------
+    output_name : str
+        Path of the tomogram
+    """
+    binning = int(binning)
+    stack, header = sg_mrcread.sg_mrcread(stack_name)
+    n_tilts = stack.shape[2]
+
+    angles = np.loadtxt(tlt_name, ndmin=1)
+    if len(angles) != n_tilts:
+        raise ValueError(f"ACHTUNG!!! {tlt_name} has {len(angles)} tilt angles, but {stack_name} has {n_tilts} tilts!!!")
+
+    if xf_name is not None:
+        xf = tomoman_apply_xf.tomoman_read_xf(xf_name)
+        if xf.shape[0] != n_tilts:
+            raise ValueError(f"ACHTUNG!!! {xf_name} has {xf.shape[0]} transforms, but {stack_name} has {n_tilts} tilts!!!")
+
+    # Pixel size of the tomogram
+    pixelsize = (header['xlen'] / header['mx'] if header['mx'] > 0 else 1.0) * binning
+
+    def weight_tilt(i):
+        if xf_name is not None:
+            img = tomoman_apply_xf.tomoman_transform_image(stack[:, :, i], xf[i], binning, method=method)
+        else:
+            img = tomoman_bin_stack.tomoman_bin_image(stack[:, :, i], binning, method)
+        return tomoman_rweight_image(img, radial)
+
+    print(f"TOMOMAN: Weighting tilts of {stack_name}...")
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        tilts = list(executor.map(weight_tilt, range(n_tilts)))
+        weighted = np.stack(tilts, axis=2)
+        del tilts
+
+        nx, ny = weighted.shape[:2]
+        nz = max(int(thickness) // binning, 1)
+        slabs = [(z, min(z + int(slab_size), nz)) for z in range(0, nz, int(slab_size))]
+
+        out_header = sg_generate_mrc_header.sg_generate_mrc_header()
+        out_header = sg_append_mrc_label_enhanced.sg_append_mrc_label(out_header, f"TOMOMAN: Weighted back-projection, binned by {binning}.")
+
+        def backproject(z_range):
+            return tomoman_backproject_slab(weighted, angles, nx, nz, z_range)
+
+        print(f"TOMOMAN: Back-projecting {nx} x {ny} x {nz} tomogram...")
+        with sg_mrc_stream_writer.sg_mrc_stream_writer(output_name, out_header, mode=mode, pixelsize=pixelsize) as writer:
+            # Slabs are back-projected in chunks to bound memory use
+            chunk = max(int(n_workers), 1) * 2
+            for start in range(0, len(slabs), chunk):
+                for slab in executor.map(backproject, slabs[start:start + chunk]):
+                    writer.append(slab)
+
+    return output_name
+
+
+def tomoman_rweight_image(image, radial=(0.35, 0.035)):
+    """
+    Apply the R-weighting filter along X to a tilt with its tilt axis along Y.
+
+    The image mean is subtracted and the image is zero-padded to twice its
+    width, so that filtering does not wrap around.
+
+    Parameters:
+    -----------
+    image : ndarray
+        Tilt (x, y)
+    radial : tuple
+        Cutoff and Gaussian falloff of the filter in cycles/pixel
+
+    Returns:
+    --------
+    weighted_img : ndarray
+        Weighted tilt (x, y)
+    """
+    image = np.asarray(image, dtype=tomoman_precision.tomoman_real_dtype())
+    x, y = image.shape
+
+    padded = np.zeros((2 * x, y), dtype=image.dtype)
+    padded[:x, :] = image - image.mean(dtype=np.float64)
+
+    spectrum = tomoman_fft.rfft2(padded)
+    spectrum *= tomoman_rweight_filter(2 * x, radial)[:, np.newaxis]
+
+    return tomoman_fft.irfft2(spectrum, padded.shape)[:x, :]
+
+
+def tomoman_rweight_filter(n, radial=(0.35, 0.035)):
+    """
+    Ramp filter |f| with a Gaussian falloff beyond the cutoff, for n samples
+    in fftfreq order. The zero frequency keeps a quarter of the first sample,
+    as for a band-limited ramp.
+    """
+    f = np.abs(np.fft.fftfreq(n))
+    cutoff, sigma = radial
+    weights = f.copy()
+    weights[0] = 0.25 / n
+    if sigma > 0:
+        weights *= np.exp(-np.square(np.maximum(f - cutoff, 0)) / (2 * sigma ** 2))
+    else:
+        weights[f > cutoff] = 0
+
+    return weights.astype(tomoman_precision.tomoman_real_dtype())
+
+
+def tomoman_backproject_slab(weighted, angles, nx, nz, z_range):
+    """
+    Back-project a Z slab of a tomogram from R-weighted tilts.
+
+    A voxel at centered coordinates (x, y, z) projects onto x' = x cos(t) +
+    z sin(t), y' = y in a tilt at angle t. Values are linearly interpolated,
+    and rays that leave the tilt contribute nothing.
+
+    Parameters:
+    -----------
+    weighted : ndarray
+        R-weighted tilts (x, y, n_tilts)
+    angles : array_like
+        Tilt angles (degrees)
+    nx : int
+        Width of the tomogram
+    nz : int
+        Thickness of the tomogram
+    z_range : tuple
+        First and last (exclusive) Z section of the slab
+
+    Returns:
+    --------
+    slab : ndarray
+        Slab (nx, ny, z1 - z0)
+    """
+    in_x, ny, n_tilts = weighted.shape
+    z0, z1 = z_range
+    real_dtype = tomoman_precision.tomoman_real_dtype()
+
+    xc = np.arange(nx) + 0.5 - nx / 2
+    zc = np.arange(z0, z1) + 0.5 - nz / 2
+
+    # Accumulate as (x, z, y) so that gathered rows are contiguous
+    slab = np.zeros((nx, z1 - z0, ny), dtype=real_dtype)
+    for i, angle in enumerate(np.deg2rad(angles)):
+        xp = xc[:, np.newaxis] * np.cos(angle) + zc[np.newaxis, :] * np.sin(angle) + in_x / 2 - 0.5
+        x0 = np.floor(xp).astype(np.intp)
+        w1 = (xp - x0).astype(real_dtype)
+        w0 = 1 - w1
+
+        # Zero weights outside the tilt
+        w0[(x0 < 0) | (x0 >= in_x)] = 0
+        w1[(x0 < -1) | (x0 >= in_x - 1)] = 0
+        x1 = np.clip(x0 + 1, 0, in_x - 1)
+        x0 = np.clip(x0, 0, in_x - 1)
+
+        proj = weighted[:, :, i]
+        slab += proj[x0] * w0[:, :, np.newaxis]
+        slab += proj[x1] * w1[:, :, np.newaxis]
+
+    slab *= np.pi / n_tilts
+
+    return slab.transpose(0, 2, 1)